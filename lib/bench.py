@@ -0,0 +1,241 @@
+'''
+Throughput benchmarks for the lib/ hot paths.
+
+    PYTHONPATH=lib python3 -m bench --json bench.json
+    PYTHONPATH=lib python3 -m bench --baseline bench.json
+
+Measures Game.tick frames/s at scaled entity counts, Thread.exec
+instructions/s per opcode and Vector2D ops/s. With --baseline, prints
+each result next to the saved one.
+'''
+import sys
+import json
+import time
+import logging
+import platform
+import numpy as np
+from vector2d import V
+from cpu import Program, Thread, OPCODE
+from game import Game
+
+COUNTS = (10, 100, 1000, 10000)
+
+def timed(fn, n):
+    'Calls per second of fn() over n calls.'
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = time.perf_counter() - t0
+    return n / elapsed if elapsed > 0 else float('inf')
+
+#############################################################
+
+def spawn_enemy(game):
+    'An enemy somewhere in the top half of the screen.'
+    rand = game.random
+    enemy = game.make_enemy()
+    enemy.pos = V(rand.uniform(0, game.screen_width), rand.uniform(0, game.screen_height * 0.5))
+    game.enemies.append(enemy)
+
+def spawn_bullet(game):
+    'A bullet somewhere in the bottom quarter of the screen.'
+    rand = game.random
+    bullet = game.player_shoot(game.player)
+    bullet.pos = V(rand.uniform(0, game.screen_width), rand.uniform(game.screen_height * 0.75, game.screen_height))
+
+def refill(game, n_enemies: int, n_bullets: int):
+    'Replace the enemies and bullets culled or hit since the last call.'
+    for _ in range(n_enemies - len(game.enemies)):
+        spawn_enemy(game)
+    for _ in range(n_bullets - len(game.bullets)):
+        spawn_bullet(game)
+
+def make_game(n_enemies: int, n_bullets: int, seed = 0):
+    'A headless game with spawning off and n_enemies, n_bullets placed at random.'
+    game = Game()
+    game.init(headless=True, seed=seed)
+    game.enemies_max = n_enemies
+    game.bullets_max = n_bullets
+    game.enemy_spawn_time = float('inf')
+    refill(game, n_enemies, n_bullets)
+    return game
+
+def bench_game(counts = COUNTS, work = 20000):
+    '''
+    frames/s of Game.tick at n enemies and n bullets; frames scale down
+    as counts go up. Entities culled or hit are replaced between ticks,
+    outside the timed part, so every tick starts with the full count;
+    enemies and bullets are the mean live counts after a tick.
+    '''
+    results = {}
+    for n in counts:
+        game = make_game(n, n)
+        frames = max(5, work // n)
+        game.dt = 1.0 / game.sim_rate
+        elapsed = 0.0
+        enemies = bullets = 0
+        for _ in range(frames):
+            refill(game, n, n)
+            t0 = time.perf_counter()
+            game.tick()
+            elapsed += time.perf_counter() - t0
+            enemies += len(game.enemies)
+            bullets += len(game.bullets)
+        results[str(n)] = {
+            'fps': frames / elapsed if elapsed > 0 else float('inf'),
+            'frames': frames,
+            'enemies': enemies / frames,
+            'bullets': bullets / frames,
+        }
+    return results
+
+#############################################################
+
+class BenchState:
+    def accelerate(self, a):
+        pass
+
+    def noop(self):
+        pass
+
+    def tick_cpu(self, dt):
+        pass
+
+# Operand and the values to push first, per opcode.
+OPCODE_CASES = {
+    'nop': (None, ()),
+    'const': (V(1.0, 2.0), ()),
+    'rand': (None, (V(-1.0), V(1.0))),
+    'acc': (None, (V(1.0),)),
+    'sleep': (None, (0.0,)),
+    'inv': (None, (V(1.0),)),
+    'add': (None, (V(1.0), V(2.0))),
+    'sub': (None, (V(1.0), V(2.0))),
+    'mul': (None, (V(1.0), V(2.0))),
+    'div': (None, (V(1.0), V(2.0))),
+    'norm': (None, (V(3.0, 4.0),)),
+    'normal': (None, (V(3.0, 4.0),)),
+    'repeat': (None, ()),
+    'call': (('noop', ()), ()),
+}
+
+def bench_cpu(n = 100000):
+    'instructions/s of Thread.exec per opcode, operands already on the stack.'
+    prog = Program('bench', [('nop',)])
+    results = {}
+    for name, (arg, stack) in OPCODE_CASES.items():
+        thread = Thread(name, BenchState(), prog)
+        op = OPCODE[name]
+        stack = list(stack)
+        exec = thread.exec
+
+        def step():
+            thread._stack = stack.copy()
+            exec(op, arg)
+
+        def overhead():
+            thread._stack = stack.copy()
+
+        # Report the exec cost alone.
+        total = 1.0 / timed(step, n) - 1.0 / timed(overhead, n)
+        results[name] = 1.0 / total if total > 0 else float('inf')
+    return results
+
+#############################################################
+
+def bench_vector(n = 200000):
+    'ops/s of Vector2D arithmetic.'
+    a, b = V(1.5, -2.5), V(0.25, 4.0)
+    c = V(1.0, 1.0)
+    cases = {
+        'add': lambda: a + b,
+        'sub': lambda: a - b,
+        'mul_scalar': lambda: a * 0.5,
+        'mul_vector': lambda: a * b,
+        'div_scalar': lambda: a / 3.0,
+        'dot': lambda: a.dot(b),
+        'norm': lambda: a.norm(),
+        'normal': lambda: a.normal(),
+        'rotated': lambda: a.rotated(30.0),
+        'reflected': lambda: a.reflected(V(0.6, 0.8)),
+        'iadd': lambda: c.iadd(b),
+        'iadd_scaled': lambda: c.iadd_scaled(b, 0.5),
+        'set': lambda: c.set(1.0, 2.0),
+    }
+    return {name: timed(fn, n) for name, fn in cases.items()}
+
+#############################################################
+
+def run(only = None, quick = False):
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+    }
+    scale = 10 if quick else 1
+    if only in (None, 'game'):
+        counts = COUNTS[:-1] if quick else COUNTS
+        results['game'] = bench_game(counts, 20000 // scale)
+    if only in (None, 'cpu'):
+        results['cpu'] = bench_cpu(100000 // scale)
+    if only in (None, 'vector'):
+        results['vector'] = bench_vector(200000 // scale)
+    return results
+
+def flatten(results):
+    'name -> rate, for the numbers that are compared.'
+    flat = {}
+    for name, fps in results.get('game', {}).items():
+        flat[f"game/{name}"] = fps['fps']
+    for section in ('cpu', 'vector'):
+        for name, rate in results.get(section, {}).items():
+            flat[f"{section}/{name}"] = rate
+    return flat
+
+def compare(results, baseline, tolerance = 0.1, out = sys.stdout):
+    'Print current vs baseline rates; return the names that got slower than tolerance.'
+    current, previous = flatten(results), flatten(baseline)
+    slower = []
+    print(f"{'benchmark':<24} {'baseline':>14} {'current':>14} {'change':>8}", file=out)
+    for name, rate in current.items():
+        base = previous.get(name)
+        if not base:
+            print(f"{name:<24} {'-':>14} {rate:>14.1f}", file=out)
+            continue
+        change = rate / base - 1.0
+        flag = ''
+        if change < - tolerance:
+            slower.append(name)
+            flag = ' SLOWER'
+        print(f"{name:<24} {base:>14.1f} {rate:>14.1f} {change:>+7.1%}{flag}", file=out)
+    return slower
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', choices=('game', 'cpu', 'vector'))
+    parser.add_argument('--quick', action='store_true', help='fewer iterations, skip the largest count')
+    parser.add_argument('--json', metavar='PATH', help='write results as JSON')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against saved JSON results')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown before flagging (fraction)')
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = run(args.only, args.quick)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.tolerance)
+        return 1 if slower else 0
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,66 @@
-from entity import Entity
+import numpy as np
+from entity import Entity, V
 
 class Bullet(Entity):
-    pass
+    KIND = 2
+
+class BulletIndex:
+    '''
+    Bullet positions as of one step, for "bullets near p" queries.
+
+    Game.tick rebuilds it with update() once bullets have moved, so every
+    enemy program asking about bullets in that step shares one snapshot.
+    '''
+    # Enemies per block of the batched query; bounds the (enemies, bullets) temporaries.
+    BLOCK = 1 << 20
+
+    def __init__(self):
+        self.bullets: list = []
+        self.pos = np.zeros((0, 2))
+
+    def __repr__(self):
+        return f"{type(self).__name__}(bullets={len(self.bullets)})"
+
+    def __len__(self):
+        return len(self.bullets)
+
+    def update(self, bullets):
+        self.bullets = list(bullets)
+        if self.bullets:
+            store = self.bullets[0].store
+            self.pos = store.pos[store.rows(self.bullets)]
+        else:
+            self.pos = np.zeros((0, 2))
+
+    def within(self, p: V, r0: float, r1: float) -> list:
+        'Bullets at distance r0 <= d < r1 from p, nearest first.'
+        if not self.bullets:
+            return []
+        d = np.hypot(self.pos[:, 0] - p.x, self.pos[:, 1] - p.y)
+        idx = np.flatnonzero((r0 <= d) & (d < r1))
+        idx = idx[np.argsort(d[idx], kind='stable')]
+        bullets = self.bullets
+        return [bullets[i] for i in idx.tolist()]
+
+    def nearest_approaching(self, pos: np.ndarray, vel: np.ndarray, r0, r1) -> np.ndarray:
+        '''
+        For each row of pos, the index of the nearest bullet at distance
+        r0 <= d < r1 that vel is heading towards, or -1.
+        '''
+        n = len(pos)
+        nearest = np.full(n, -1, dtype=np.intp)
+        if not self.bullets or not n:
+            return nearest
+        r0 = np.broadcast_to(r0, (n,))
+        r1 = np.broadcast_to(r1, (n,))
+        step = max(1, self.BLOCK // len(self.bullets))
+        for i in range(0, n, step):
+            s = slice(i, i + step)
+            dp = pos[s, None, :] - self.pos[None, :, :]
+            d = np.hypot(dp[..., 0], dp[..., 1])
+            heading = (dp[..., 0] * vel[s, None, 0] + dp[..., 1] * vel[s, None, 1]) < 0
+            d[~ ((r0[s, None] <= d) & (d < r1[s, None]) & heading)] = np.inf
+            j = np.argmin(d, axis=1)
+            hit = np.isfinite(d[np.arange(len(j)), j])
+            nearest[s] = np.where(hit, j, -1)
+        return nearest
@@ -1,5 +1,6 @@
 import sys
 import logging
+from types import MappingProxyType
 from random import Random
 from vector2d import V, V_0, V_1, V__1
 from timer import Duration
@@ -18,40 +19,117 @@ def to_float(x):
 
 thread_id = program_id = cpu_id = 0
 
+# Opcode numbers are indexes into this tuple and into Thread.dispatch.
+ISNS = (
+    'nop', 'label', 'pause', 'resume', 'halt', 'repeat', 'br', 'jmp',
+    'thread_yield', 'thread_yield_to', 'sleep',
+    'pop', 'push', 'dup', 'const',
+    'rand', 'inv', 'add', 'sub', 'mul', 'div', 'abs', 'norm', 'normal', 'rotate',
+    'call', 'acc',
+)
+OPCODE = {name: op for op, name in enumerate(ISNS)}
+# Instructions that keep their arguments as an immediate operand
+# instead of having them pushed as constants, and how to get it:
+IMMEDIATE = {
+    'const': lambda isn: isn[1],
+    'call': lambda isn: (isn[1], isn[2:]),
+    'thread_yield_to': lambda isn: isn[1],
+}
+
 class Program:
+    '''
+    Compiled, read-only bytecode: code is a tuple and labels a read-only
+    mapping, so any number of Threads can share one Program.
+    '''
     def __init__(self, name, isns = []):
         global program_id
         program_id += 1
         self.id = program_id
         self.name = name
-        self.isns = self.prepare_instructions(isns)
+        self.source = tuple(isns)
         self.labels = {}
+        self.isns = []
+        self.code = tuple(self.prepare_instructions(isns))
+        self.isns = tuple(self.isns)
+        self.labels = MappingProxyType(self.labels)
 
     def __repr__(self):
         return f"{type(self).__name__}(id={self.id}, name={self.name!r})"
 
     __str__ = __repr__
 
-    def prepare_instructions(self, isns):
-        result = []
-        ip = 0
+    def __reduce__(self):
+        # labels is a mappingproxy, which does not pickle: recompile instead.
+        return (type(self), (self.name, self.source))
 
-        def emit(isn):
-            result.append(isn)
-            ip += 1
+    def prepare_instructions(self, isns):
+        '''
+        Compile to bytecode: a list of (opcode, operand) pairs.
+        self.isns keeps the expanded source tuples, one per opcode.
+        '''
+        code = []
+
+        def emit(isn, operand = None):
+            opcode = OPCODE.get(isn[0])
+            if opcode is None:
+                logger.error("%s", f"invalid isn {isn!r}")
+                raise ValueError(f"invalid isn {isn!r}")
+            self.isns.append(isn)
+            code.append((opcode, operand))
 
         for isn in isns:
             if not isinstance(isn, tuple):
                 isn = (isn,)
-            if isn[0] == 'label':
-                self.labels[isn[1]] = ip + 1
-            elif isn[0] not in ('const', 'call') and len(isn) > 1:
+            name = isn[0]
+            if name == 'label':
+                self.labels[isn[1]] = len(code)
+            elif name in IMMEDIATE:
+                emit(isn, IMMEDIATE[name](isn))
+            else:
                 for arg in reversed(isn[1:]):
-                    result.append(('const', arg))
-                isn = (isn[0],)
-            result.append(isn)
-        # ic(result)
-        return result
+                    emit(('const', arg), arg)
+                emit((name,))
+        return code
+
+def source_key(isns) -> tuple:
+    'Comparable form of program source: bare names as 1-tuples, V as (x, y).'
+    def arg(x):
+        return ('V', x.x, x.y) if isinstance(x, V) else x
+    return tuple(
+        tuple(arg(x) for x in isn) if isinstance(isn, tuple) else (isn,)
+        for isn in isns
+    )
+
+class ProgramRegistry:
+    '''
+    Programs by name, each compiled once by define().
+    Defining a name again with the same source returns the compiled
+    program; with different source it is an error.
+    '''
+    def __init__(self):
+        self.programs: dict = {}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self.programs)!r})"
+
+    def __len__(self):
+        return len(self.programs)
+
+    def __contains__(self, name):
+        return name in self.programs
+
+    def __getitem__(self, name) -> Program:
+        return self.programs[name]
+
+    def define(self, name, isns) -> Program:
+        prog = self.programs.get(name)
+        if prog is None:
+            prog = self.programs[name] = Program(name, isns)
+        elif source_key(isns) != source_key(prog.source):
+            raise ValueError(f"program {name!r} is already defined with different source")
+        return prog
+
+program_registry = ProgramRegistry()
 
 class State:
     def __init__(self):
@@ -60,23 +138,26 @@ class State:
         self.dt = None
 
     def tick(self):
-        self.pos += self.vel * self.dt
+        self.pos.iadd_scaled(self.vel, self.dt)
 
     def acc(self, a):
         assert isinstance(a, V)
         #print(f"a={a} dp={self.vel}")
-        self.vel += a
+        self.vel.iadd(a)
 
 class CPU:
-    def __init__(self, state, progs):
+    def __init__(self, state, progs, rand: Random = None):
+        'rand, if given, seeds the threads\' random generators.'
         global cpu_id
         cpu_id += 1
         self.id = cpu_id
         self.state = state
         self.progs = progs
+        self.pool = None
         self.thread_queue = []
         self.thread_by_name = {
-            prog.name: Thread(prog.name, state, prog)
+            prog.name: Thread(prog.name, state, prog,
+                              Random(rand.getrandbits(64)) if rand else None)
             for prog in self.progs
         }
         self.threads = list(self.thread_by_name.values())
@@ -84,7 +165,15 @@ class CPU:
             thread.cpu = self
         self.thread_queue = self.threads.copy()
 
+    def reset(self, rand: Random = None):
+        'Restart every thread, reseeded from rand like a new CPU. Detach from the pool first.'
+        for thread in self.threads:
+            thread.reset(Random(rand.getrandbits(64)) if rand else None)
+        self.thread_queue = self.threads.copy()
+
     def tick(self, dt: Duration):
+        if self.pool is not None:
+            return # Stepped by CPUPool.
         for thread in self.threads:
             if thread.running:
                 thread.tick(dt)
@@ -115,7 +204,7 @@ class CPU:
         to_thread.resume()
 
 class Thread:
-    def __init__(self, name, state, prog: Program):
+    def __init__(self, name, state, prog: Program, rand: Random = None):
         global thread_id
         thread_id += 1
         self.id = thread_id
@@ -125,46 +214,74 @@ class Thread:
         self._stack: list = [V_0]
         self._stack_max: int = 128
         self._ip: int = 0
-        self._args: tuple = EMPTY_TUPLE
-        self._isn: str = None
+        self._op: int = OPCODE['nop']
+        self._arg = None
         self._sleep: float = 0.0
-        self._rand: Random = Random()
+        self._rand: Random = rand or Random()
         self._result = None
         self.running: bool = True
         self.halted: bool = False
         self.dt: Duration = 0.0
 
+    def reset(self, rand: Random = None):
+        'Restart at the first instruction with a fresh stack.'
+        self._stack = [V_0]
+        self._ip = 0
+        self._op = OPCODE['nop']
+        self._arg = None
+        self._sleep = 0.0
+        if rand is not None:
+            self._rand = rand
+        self._result = None
+        self.running = True
+        self.halted = False
+        self.dt = 0.0
+
+    def get_state(self) -> dict:
+        'Picklable execution state, for moving a thread between processes.'
+        return {
+            'ip': self._ip,
+            'sleep': self._sleep,
+            'stack': list(self._stack),
+            'running': self.running,
+            'halted': self.halted,
+            'rand': self._rand.getstate(),
+        }
+
+    def set_state(self, state: dict):
+        self._ip = state['ip']
+        self._sleep = state['sleep']
+        self._stack = list(state['stack'])
+        self.running = state['running']
+        self.halted = state['halted']
+        self._rand.setstate(state['rand'])
+
     @property
     def active(self):
         return self.running and not self.halted
 
     def __repr__(self):
-        return f"{type(self).__name__} | id {self.id} | state {self.state} | dt {self.dt} | isn {self._isn} | ip {self._ip} | stack {self._stack[-3:]!r} | wait {self._sleep}"
+        return f"{type(self).__name__} | id {self.id} | state {self.state} | dt {self.dt} | isn {ISNS[self._op]} {self._arg!r} | ip {self._ip} | stack {self._stack[-3:]!r} | wait {self._sleep}"
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.dispatch = tuple(getattr(cls, name) for name in ISNS)
 
     def tick(self, dt: Duration):
         self.dt, next_isn = self.sleep_(dt)
         self.state.tick_cpu(self.dt)
-        if next_isn and self.active:
-            self.exec(self.fetch_isn_())
+        if next_isn:
+            self.step()
         # print(self)
 
-    def exec(self, isn):
-        # print(f"exec: {id(self.state)} {isn!r}")
-        self._isn = isn
-        self._args = isn
-        opcode = isn[0]
-        try:
-            # print(f"{self.name} : {self._prog.name} : {self._ip} : {isn}")
-            if not isinstance(isn, tuple):
-                breakpoint()
-            assert isinstance(isn, tuple)
-            assert isinstance(opcode, str)
-            microcode = getattr(self, opcode)
-            assert microcode is not None
-        except (AttributeError, AssertionError) as exe:
-            logger.error("%s", f"invalid ins {isn!r}")
-            raise exe
-        microcode()
+    def step(self):
+        if self.active:
+            self.exec(*self.fetch_isn_())
+
+    def exec(self, op: int, arg = None):
+        self._op = op
+        self._arg = arg
+        self.dispatch[op](self)
 
     # Microcode:
     def sleep_(self, dt):
@@ -181,14 +298,13 @@ class Thread:
     def fetch_isn_(self):
         ip = self._ip
         self._ip += 1
-        isn = self._prog.isns[ip]
-        return isn
+        return self._prog.code[ip]
 
     def jmp_(self, ip_or_label):
         if isinstance(ip_or_label, str):
-            self._ip = self.program.labels[ip_or_label]
+            self._ip = self._prog.labels[ip_or_label]
         else:
-            self._ip = abs(int(ip_or_label) % len(self._prog.isns))
+            self._ip = abs(int(ip_or_label) % len(self._prog.code))
 
     def top_(self, default = V_0):
         return self._stack[-1] if self._stack else default
@@ -235,7 +351,7 @@ class Thread:
     def thread_yield(self):
         self.cpu.thread_yield(self)
     def thread_yield_to(self):
-        self.cpu.thread_yield_to(self, self._args[1])
+        self.cpu.thread_yield_to(self, self._arg)
     def sleep(self):
         self._sleep = to_float(self.pop_(V_0))
 
@@ -249,7 +365,7 @@ class Thread:
         if self._stack:
             self._stack.push(-1, self.top_())
     def const(self):
-        self.push_(self._args[1])
+        self.push_(self._arg)
 
     # Arithmetic:
     def rand(self):
@@ -290,12 +406,13 @@ class Thread:
 
     # State instructions:
     def call(self):
-        # print(f"call: {self.state} {self._args!r}")
-        # breakpoint()
-        self._result = getattr(self.state, self._args[1])(*self._args[2:])
+        # print(f"call: {self.state} {self._arg!r}")
+        name, args = self._arg
+        self._result = getattr(self.state, name)(*args)
     # Shorthand:
     def acc(self):
         self._result = self.state.accelerate(self.pop_(V_0))
     # def think(self):
     #    self._result = self.state.think()
 
+Thread.dispatch = tuple(getattr(Thread, name) for name in ISNS)
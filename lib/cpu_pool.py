@@ -0,0 +1,310 @@
+from heapq import heappush, heappop
+import numpy as np
+from cpu import CPU, Thread, Program, OPCODE, V, V_0, V_1, V__1
+
+class ProgramBatch:
+    '''
+    VM state of every pooled thread running one Program, as arrays.
+
+    Slot i holds threads[i]: ip, wake time, running/halted flags and a
+    fixed-depth stack of 2-vectors (numbers are widened to V(x, x)).
+    Sleeping threads wait in a heap keyed by wake time and are not
+    touched until it is due, so a tick costs the awake threads only.
+    Threads at the same ip execute their instruction together;
+    VECTORIZED opcodes run as array operations, the rest fall back to
+    Thread.exec on a copy of the slot's state.
+    '''
+    def __init__(self, prog: Program, store = None, rng: np.random.Generator = None, depth: int = 16):
+        self.prog = prog
+        self.store = store
+        self.rng = rng or np.random.default_rng()
+        self.depth = depth
+        self.threads: list = []
+        self.slot: dict = {}
+        self.capacity = 0
+        self.now = 0.0
+        self.ip = np.zeros(0, dtype=np.intp)
+        self.wake_at = np.zeros(0)
+        self.sp = np.zeros(0, dtype=np.intp)
+        self.stack = np.zeros((0, depth, 2))
+        self.running = np.zeros(0, dtype=bool)
+        self.halted = np.zeros(0, dtype=bool)
+        self.rows = np.zeros(0, dtype=np.intp)
+        # Threads whose wake time has passed, and (wake_at, seq, thread)
+        # of sleeping ones; entries whose wake_at no longer matches the
+        # thread's slot (removed, or rescheduled) are dropped when popped.
+        self.awake: set = set()
+        self.parked: list = []
+        self.parks = 0
+        self.operands = [self.vector_operand(op, arg) for op, arg in prog.code]
+
+    def __repr__(self):
+        return f"{type(self).__name__}(prog={self.prog}, threads={len(self.threads)})"
+
+    def __len__(self):
+        return len(self.threads)
+
+    COLUMNS = ('ip', 'wake_at', 'sp', 'stack', 'running', 'halted', 'rows')
+
+    @staticmethod
+    def vector_operand(op, arg):
+        'const operands as 2-vectors, None if not numeric.'
+        if op != OPCODE['const']:
+            return None
+        if isinstance(arg, V):
+            return np.array((arg.x, arg.y))
+        if isinstance(arg, (int, float)):
+            return np.array((arg, arg), dtype=float)
+        return None
+
+    def grow(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        n = len(self.threads)
+        for name in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    # Moving state between Thread objects and slots:
+
+    def load(self, i: int, thread: Thread):
+        self.ip[i] = thread._ip
+        self.wake_at[i] = self.now + thread._sleep
+        self.running[i] = thread.running
+        self.halted[i] = thread.halted
+        stack = thread._stack[- self.depth:]
+        self.sp[i] = len(stack)
+        for k, value in enumerate(stack):
+            if isinstance(value, V):
+                self.stack[i, k] = (value.x, value.y)
+            elif isinstance(value, (int, float)):
+                self.stack[i, k] = (value, value)
+            else:
+                raise TypeError(f"{thread!r}: pooled threads need a numeric stack, got {value!r}")
+
+    def unload(self, i: int, thread: Thread):
+        thread._ip = int(self.ip[i])
+        thread._sleep = max(float(self.wake_at[i]) - self.now, 0.0)
+        thread.running = bool(self.running[i])
+        thread.halted = bool(self.halted[i])
+        thread._stack = [V(x, y) for x, y in self.stack[i, :self.sp[i]].tolist()]
+
+    def add(self, thread: Thread):
+        i = len(self.threads)
+        if i >= self.capacity:
+            self.grow(max(self.capacity * 2, 16))
+        self.threads.append(thread)
+        self.slot[thread] = i
+        self.rows[i] = getattr(thread.state, 'row', -1)
+        self.load(i, thread)
+        self.schedule(i, thread)
+
+    def remove(self, thread: Thread):
+        'Write the slot back to thread and swap the last slot into its place.'
+        i = self.slot.pop(thread)
+        self.unload(i, thread)
+        self.awake.discard(thread)
+        last = len(self.threads) - 1
+        if i != last:
+            moved = self.threads[last]
+            self.threads[i] = moved
+            self.slot[moved] = i
+            for name in self.COLUMNS:
+                column = getattr(self, name)
+                column[i] = column[last]
+        self.threads.pop()
+
+    def sync(self):
+        'Write every slot back to its Thread.'
+        for i, thread in enumerate(self.threads):
+            self.unload(i, thread)
+
+    def schedule(self, i: int, thread: Thread):
+        'Mark slot i awake or park it until its wake time; paused or halted slots are neither.'
+        self.awake.discard(thread)
+        if not self.running[i] or self.halted[i]:
+            return
+        wake_at = float(self.wake_at[i])
+        if wake_at > self.now:
+            self.parks += 1
+            heappush(self.parked, (wake_at, self.parks, thread))
+        else:
+            self.awake.add(thread)
+
+    def reschedule(self):
+        'Rebuild awake and parked after writing wake_at directly (see snapshot.restore).'
+        self.awake = set()
+        self.parked = []
+        for i, thread in enumerate(self.threads):
+            self.schedule(i, thread)
+
+    # Stack:
+
+    def push(self, sel, values):
+        full = self.sp[sel] >= self.depth
+        if full.any():
+            f = sel[full]
+            self.stack[f, :-1] = self.stack[f, 1:]
+            self.sp[f] -= 1
+        self.stack[sel, self.sp[sel]] = values
+        self.sp[sel] += 1
+
+    def pop(self, sel, default: V):
+        values = np.empty((len(sel), 2))
+        values[:] = (default.x, default.y)
+        has = self.sp[sel] > 0
+        h = sel[has]
+        self.sp[h] -= 1
+        values[has] = self.stack[h, self.sp[h]]
+        return values
+
+    # Instructions:
+
+    def tick(self, dt: float):
+        self.now = now = self.now + dt
+        parked, awake, slot = self.parked, self.awake, self.slot
+        while parked and parked[0][0] <= now:
+            wake_at, _, thread = heappop(parked)
+            i = slot.get(thread)
+            if i is not None and self.wake_at[i] == wake_at:
+                awake.add(thread)
+        if not awake:
+            return
+        # Slot order, so runs do not depend on set iteration order.
+        idx = np.sort(np.fromiter((slot[thread] for thread in awake), dtype=np.intp, count=len(awake)))
+        self.exec(idx)
+        threads = self.threads
+        asleep = (self.wake_at[idx] > now) | ~ self.running[idx] | self.halted[idx]
+        for i in idx[asleep].tolist():
+            self.schedule(i, threads[i])
+
+    def exec(self, idx):
+        ips = self.ip[idx]
+        self.ip[idx] += 1
+        code = self.prog.code
+        for ip in np.unique(ips).tolist():
+            sel = idx[ips == ip]
+            op, arg = code[ip]
+            handler = self.VECTORIZED.get(op)
+            if handler is None or not handler(self, sel, ip, arg):
+                self.fallback(sel, op, arg)
+
+    def fallback(self, sel, op, arg):
+        threads = self.threads
+        if op == OPCODE['call']:
+            # A batch_<name> classmethod on the states answers the call for all of them.
+            states = [threads[i].state for i in sel.tolist()]
+            name, args = arg
+            batch = getattr(type(states[0]), 'batch_' + name, None)
+            if batch is not None and all(type(state) is type(states[0]) for state in states):
+                batch(states, *args)
+                return
+            for i in sel.tolist():
+                threads[i].exec(op, arg)
+            return
+        for i in sel.tolist():
+            thread = threads[i]
+            self.unload(i, thread)
+            thread.exec(op, arg)
+            self.load(i, thread)
+
+    def nop_(self, sel, ip, arg):
+        return True
+
+    def repeat_(self, sel, ip, arg):
+        self.ip[sel] = 0
+        return True
+
+    def const_(self, sel, ip, arg):
+        value = self.operands[ip]
+        if value is None:
+            return False
+        self.push(sel, value)
+        return True
+
+    def pop_(self, sel, ip, arg):
+        has = sel[self.sp[sel] > 0]
+        self.sp[has] -= 1
+        return True
+
+    def rand_(self, sel, ip, arg):
+        r2 = self.pop(sel, V__1)
+        r1 = self.pop(sel, V_1)
+        t = self.rng.random((len(sel), 2))
+        self.push(sel, r1 * (1 - t) + r2 * t)
+        return True
+
+    def acc_(self, sel, ip, arg):
+        rows = self.rows[sel]
+        if self.store is None or (rows < 0).any():
+            return False
+        np.add.at(self.store.acc, rows, self.pop(sel, V_0))
+        return True
+
+    def sleep_(self, sel, ip, arg):
+        self.wake_at[sel] = self.now + self.pop(sel, V_0)[:, 0]
+        return True
+
+    VECTORIZED = {
+        OPCODE['nop']: nop_,
+        OPCODE['label']: nop_,
+        OPCODE['repeat']: repeat_,
+        OPCODE['const']: const_,
+        OPCODE['pop']: pop_,
+        OPCODE['rand']: rand_,
+        OPCODE['acc']: acc_,
+        OPCODE['sleep']: sleep_,
+    }
+
+class CPUPool:
+    '''
+    Steps the threads of many CPUs together, one ProgramBatch per Program.
+
+    Pooled CPUs are skipped by CPU.tick and their threads do not call
+    state.tick_cpu; states are expected to be integrated in batch.
+    '''
+    def __init__(self, store = None, rng: np.random.Generator = None):
+        self.store = store
+        self.rng = rng or np.random.default_rng()
+        self.batches: dict = {}
+        self.cpus: set = set()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(cpus={len(self.cpus)}, batches={len(self.batches)})"
+
+    def __len__(self):
+        return len(self.cpus)
+
+    def batch(self, prog: Program) -> ProgramBatch:
+        batch = self.batches.get(prog)
+        if batch is None:
+            batch = self.batches[prog] = ProgramBatch(prog, self.store, self.rng)
+        return batch
+
+    def add(self, cpu: CPU):
+        for thread in cpu.threads:
+            self.batch(thread._prog).add(thread)
+        cpu.pool = self
+        self.cpus.add(cpu)
+
+    def remove(self, cpu: CPU):
+        for thread in cpu.threads:
+            self.batches[thread._prog].remove(thread)
+        cpu.pool = None
+        self.cpus.discard(cpu)
+
+    def seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+        for batch in self.batches.values():
+            batch.rng = self.rng
+
+    def sync(self):
+        for batch in self.batches.values():
+            batch.sync()
+
+    def tick(self, dt: float):
+        for batch in self.batches.values():
+            batch.tick(dt)
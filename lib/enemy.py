@@ -1,18 +1,36 @@
+import logging
+import numpy as np
 from timer import Duration
 from entity import Entity, Duration, V
+from vector2d import VA
 from cpu import CPU
 
+logger = logging.getLogger(__name__)
+
 class Enemy(Entity):
+    KIND = 3
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.cpu: CPU = CPU(self, self.programs)
+        rand = self.game.random if self.game else None
+        self.cpu: CPU = CPU(self, self.programs, rand)
 
     def tick(self):
         self.cpu.tick(self.dt)
         # if self.avoid_bullets():
 
+    def reset(self, pos: V, vel: V, **kwargs):
+        super().reset(pos, vel, **kwargs)
+        self.cpu.reset(self.game.random if self.game else None)
+
+    def release(self):
+        if self.cpu.pool is not None:
+            self.cpu.pool.remove(self.cpu)
+        super().release()
+
     def tick_cpu(self, dt: Duration):
-        self.tick_pos(dt)
+        # Game.tick integrates all enemies at once.
+        pass
 
     def think(self):
         'Change direction to player.'
@@ -20,18 +38,32 @@ class Enemy(Entity):
 
     def avoid_bullets(self):
         # print(f"avoid_bullets: {self}")
-
-        def distance(bullet):
-            return (bullet.pos - self.pos).norm()
-
-        for bullet in sorted(self.game.bullets, key=distance):
+        r0 = self.sprite.size.x
+        r1 = r0 * 3
+        for bullet in self.game.bullet_index.within(self.pos, r0, r1):
             # print(f"avoid_bullets: {bullet}")
-            r0 = self.sprite.size.x
-            r1 = r0 * 3
             if self.avoid_point(bullet.pos, r0, r1):
-                print(f"avoid_bullets: avoiding {bullet} {r0} {r1}")
+                logger.debug("avoid_bullets: avoiding %s %s %s", bullet, r0, r1)
                 return True
         return False
 
+    @classmethod
+    def batch_avoid_bullets(cls, enemies: list):
+        'avoid_bullets for many enemies in one query (see ProgramBatch.fallback).'
+        index = enemies[0].game.bullet_index
+        if not len(index):
+            return
+        store = enemies[0].store
+        rows = store.rows(enemies)
+        pos, vel = store.pos[rows], store.vel[rows]
+        r0 = np.array([enemy.sprite.size.x for enemy in enemies])
+        nearest = index.nearest_approaching(pos, vel, r0, r0 * 3)
+        hit = nearest >= 0
+        if not hit.any():
+            return
+        dir = (VA(pos[hit]) - index.pos[nearest[hit]]).normal()
+        # avoid_point: set_vel(vel.reflected(dir) * 1.2)
+        store.acc[rows[hit]] += (VA(vel[hit]).reflected(dir) * 1.2).a - vel[hit]
+
     def move_toward_player(self):
         self.move_toward(self.player.pos, 0.5)
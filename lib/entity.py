@@ -1,39 +1,87 @@
 import math
 from sprite import Sprite, V, V_ZERO
 from timer import Duration
+from entity_store import EntityStore
 
 DEGREE_PER_RADIAN = 180 / math.pi
 RADIAN_PER_DEGREE = math.pi / 180
 
+default_store = EntityStore()
+
 class Entity():
     id = 0
+    # Kind of entity, as logged in EntityStore.kind.
+    KIND = 0
     def __init__(
             self,
             pos: V,
             vel: V,
             sprite: Sprite,
+            store: EntityStore = None,
             **kwargs
         ):
         self.kwargs = kwargs
-        Entity.id += 1
-        self.id = Entity.id
-        self._pos: V = pos
-        self._vel: V = vel
-        self._angle: float = None
-        self._angle_last: float = None
-        self._speed: float = None
-        self._direction: V = None
-        self._direction_last: V = None
+        self.store: EntityStore = default_store if store is None else store
         self.sprite = sprite
-        self.acc = V()
+        self.pool = None
         self.game = None
+        # Not self.reset(): subclasses extend it with state made after this.
+        Entity.reset(self, pos, vel)
+
+    def reset(self, pos: V, vel: V, **kwargs):
+        '''
+        Take a fresh row and set the initial state, as after __init__.
+        Used to reuse a released handle (see pool.EntityPool); it gets a new id.
+        '''
+        Entity.id += 1
+        self.id = Entity.id
+        self._bind_row(self.store.alloc())
+        self.store.id[self.row] = self.id
+        self.store.kind[self.row] = self.KIND
+        self.pos = pos
+        self.store.prev_pos[self.row] = (pos.x, pos.y)
+        self.vel = vel
         self.dt: Duration = 0.0
         self.min_speed: float = None
         self.max_speed: float = None
         self.friction = 0.0
-        for k, v in kwargs.items():
+        for k, v in {**self.kwargs, **kwargs}.items():
             self.__setattr__(k, v)
 
+    @classmethod
+    def attach(cls, store: EntityStore, row: int, sprite: Sprite, **kwargs):
+        '''
+        A handle on a row allocated elsewhere, e.g. by the main process of
+        a sharded simulation. The row's values are left as they are.
+        '''
+        entity = cls.__new__(cls)
+        entity.kwargs = kwargs
+        entity.id = int(store.id[row])
+        entity.store = store
+        entity.sprite = sprite
+        entity.pool = None
+        entity.game = None
+        entity.dt = 0.0
+        entity._bind_row(row)
+        for k, v in kwargs.items():
+            entity.__setattr__(k, v)
+        return entity
+
+    def rebind(self, row: int):
+        'Point the handle at another live row of its store, e.g. after restoring it.'
+        self._bind_row(row)
+        self.id = int(self.store.id[row])
+
+    def _bind_row(self, row: int):
+        self.row: int = row
+        self._angle: float = None
+        self._angle_last: float = None
+        self._speed: float = None
+        self._direction: V = None
+        self._direction_last: V = None
+        self._vel_version: int = 0
+        self.sprite.bind(self.store, row)
+
     def __str__(self):
         return self.__repr__()
 
@@ -45,30 +93,78 @@ class Entity():
         return self.sprite.rect
 
     def check(self):
-        assert isinstance(self._pos, V)
-        assert isinstance(self._vel, V)
-        assert isinstance(self.acc, V)
+        assert self.store.alive[self.row]
         assert isinstance(self.dt, float)
 
+    def release(self):
+        '''
+        Return the row to the store, and the handle to its pool if it has
+        one; the handle must not be used afterwards.
+        '''
+        self.store.free(self.row)
+        if self.pool is not None:
+            self.pool.put(self)
+
     @property
     def pos(self):
-        return self._pos
+        return V(*self.store.pos[self.row].tolist())
 
     @pos.setter
     def pos(self, pos: V):
-        self.sprite.pos = self._pos = pos
+        self.store.pos[self.row] = (pos.x, pos.y)
 
     @property
     def vel(self):
-        return self._vel
+        return V(*self.store.vel[self.row].tolist())
 
     @vel.setter
     def vel(self, vel: V):
-        self._vel = vel
+        self.store.vel[self.row] = (vel.x, vel.y)
         self._speed = self._angle = self._direction = None
 
+    @property
+    def acc(self):
+        return V(*self.store.acc[self.row].tolist())
+
+    @acc.setter
+    def acc(self, acc: V):
+        self.store.acc[self.row] = (acc.x, acc.y)
+
+    @property
+    def friction(self):
+        return float(self.store.friction[self.row])
+
+    @friction.setter
+    def friction(self, friction: float):
+        self.store.friction[self.row] = friction or 0.0
+
+    # None (no limit) is stored as 0.0.
+    @property
+    def min_speed(self):
+        return float(self.store.min_speed[self.row]) or None
+
+    @min_speed.setter
+    def min_speed(self, s: float):
+        self.store.min_speed[self.row] = s or 0.0
+
+    @property
+    def max_speed(self):
+        return float(self.store.max_speed[self.row]) or None
+
+    @max_speed.setter
+    def max_speed(self, s: float):
+        self.store.max_speed[self.row] = s or 0.0
+
+    def _check_vel_cache(self):
+        'Drop cached angle/speed/direction if integrate() moved vel.'
+        version = self.store.version[self.row]
+        if version != self._vel_version:
+            self._vel_version = version
+            self._speed = self._angle = self._direction = None
+
     @property
     def angle(self):
+        self._check_vel_cache()
         if self._angle is None:
             if self.vel.x or self.vel.y:
                 self._angle_last = math.atan2(self.vel.y, self.vel.x) * DEGREE_PER_RADIAN
@@ -84,31 +180,35 @@ class Entity():
 
     @property
     def speed(self):
+        self._check_vel_cache()
         if self._speed is None:
             self._direction_and_speed()
         return self._speed
 
     @speed.setter
     def speed(self, s: float):
-        self.vel = self._vel.normal() * s
+        self.vel = self.vel.normal() * s
         return s
 
     @property
     def direction(self):
+        self._check_vel_cache()
         if self._direction is None:
             self._direction_and_speed()
         return self._direction
 
     def _direction_and_speed(self):
         if self.vel.x or self.vel.y:
-            self._direction_last, self._speed = self._vel.normal_and_norm()
+            self._direction_last, self._speed = self.vel.normal_and_norm()
         else:
             self._speed = 0
         self._direction = self._direction_last
 
     def accelerate(self, a: V):
         assert isinstance(a, V)
-        self.acc += a
+        acc = self.store.acc[self.row]
+        acc[0] += a.x
+        acc[1] += a.y
 
     ###############################################
 
@@ -121,13 +221,16 @@ class Entity():
 
     def tick_pos(self, dt: Duration):
         # self.check()
-        self.vel += self.acc * 0.99
-        self.acc = V() # V_0
-        if self.friction:
-            self.vel -= self.vel * (self.friction * dt)
+        vel = self.vel
+        vel.iadd_scaled(self.acc, 0.99)
+        self.acc = V_ZERO
+        friction = self.friction
+        if friction:
+            vel.iadd_scaled(vel, - (friction * dt))
+        self.vel = vel
         if self.max_speed or self.min_speed:
             self.limit_speed()
-        self.pos += self.vel * dt
+        self.pos = self.pos.iadd_scaled(self.vel, dt)
 
     ###############################################
 
@@ -180,6 +283,6 @@ class Entity():
     def think(self):
         pass
 
-    def draw(self, screen):
-        self.sprite.draw(screen)
+    def draw(self, screen, pos: V = None):
+        self.sprite.draw(screen, pos)
 
@@ -0,0 +1,56 @@
+class EntityList:
+    '''
+    Unordered collection of entities with O(1) swap-remove.
+
+    remove() only queues an entity: it disappears from iteration and
+    len() at once, but stays in place until flush() swap-removes and
+    releases everything queued, once per frame. An entity keeps its
+    slot until then, so iterating while removing is safe.
+    '''
+    def __init__(self, entities = ()):
+        self.items: list = []
+        self.index: dict = {}
+        self.pending: dict = {}
+        for entity in entities:
+            self.append(entity)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(len={len(self)}, pending={len(self.pending)})"
+
+    def __len__(self):
+        return len(self.items) - len(self.pending)
+
+    def __iter__(self):
+        if not self.pending:
+            return iter(self.items)
+        pending = self.pending
+        return (entity for entity in self.items if entity not in pending)
+
+    def __contains__(self, entity):
+        return entity in self.index and entity not in self.pending
+
+    def append(self, entity):
+        self.index[entity] = len(self.items)
+        self.items.append(entity)
+
+    def remove(self, entity):
+        'Queue entity for the next flush(); removing twice is harmless.'
+        if entity in self.index:
+            self.pending[entity] = True
+
+    def flush(self) -> int:
+        'Swap-remove and release the queued entities, in the order queued.'
+        pending = self.pending
+        if not pending:
+            return 0
+        items, index = self.items, self.index
+        for entity in pending:
+            i = index.pop(entity)
+            last = items.pop()
+            if last is not entity:
+                items[i] = last
+                index[last] = i
+            entity.release()
+        n = len(pending)
+        pending.clear()
+        return n
@@ -0,0 +1,121 @@
+import numpy as np
+from vector2d import VA
+
+class EntityStore:
+    '''
+    Structure-of-arrays storage for entity physics state.
+
+    Each entity owns one row; Entity is a thin handle holding its row number.
+    Rows are recycled through a free list, arrays grow by doubling.
+    '''
+    def __init__(self, capacity: int = 64):
+        self.capacity = 0
+        self.size = 0
+        self.free_rows: list = []
+        self.pos = np.zeros((0, 2))
+        # pos at the start of the current simulation step, for interpolation.
+        self.prev_pos = np.zeros((0, 2))
+        self.vel = np.zeros((0, 2))
+        self.acc = np.zeros((0, 2))
+        self.friction = np.zeros(0)
+        self.min_speed = np.zeros(0)
+        self.max_speed = np.zeros(0)
+        self.alive = np.zeros(0, dtype=bool)
+        # Bumped whenever vel changes behind the handles' back (see integrate).
+        self.version = np.zeros(0, dtype=np.int64)
+        # Entity.id and Entity.KIND of the row's owner, for logging (see trajectory).
+        self.id = np.zeros(0, dtype=np.int64)
+        self.kind = np.zeros(0, dtype=np.uint8)
+        self.grow(capacity)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(size={self.size}, capacity={self.capacity}, free={len(self.free_rows)})"
+
+    def __len__(self):
+        return self.size - len(self.free_rows)
+
+    COLUMNS = ('pos', 'prev_pos', 'vel', 'acc', 'friction', 'min_speed', 'max_speed', 'alive', 'version', 'id', 'kind')
+
+    def grow(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        for name in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.capacity] = old
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def alloc(self) -> int:
+        'Return a zeroed row.'
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            if self.size >= self.capacity:
+                self.grow(max(self.capacity * 2, 16))
+            row = self.size
+            self.size += 1
+        for name in self.COLUMNS:
+            getattr(self, name)[row] = 0
+        self.alive[row] = True
+        return row
+
+    def free(self, row: int):
+        if self.alive[row]:
+            self.alive[row] = False
+            self.free_rows.append(row)
+
+    def save_prev(self):
+        self.prev_pos[:self.size] = self.pos[:self.size]
+
+    def interpolated(self, alpha: float) -> np.ndarray:
+        'Positions alpha of the way from prev_pos to pos, for drawing.'
+        n = self.size
+        return self.prev_pos[:n] + (self.pos[:n] - self.prev_pos[:n]) * alpha
+
+    def rows(self, entities) -> np.ndarray:
+        return np.fromiter((e.row for e in entities), dtype=np.intp)
+
+
+def integrate(entities, dt: float):
+    'Batch version of Entity.tick_pos for entities sharing one store.'
+    if not entities:
+        return
+    store = next(iter(entities)).store
+    integrate_rows(store, store.rows(entities), dt)
+
+def integrate_rows(store: EntityStore, rows: np.ndarray, dt: float):
+    vel = store.vel[rows]
+    vel += store.acc[rows] * 0.99
+    store.acc[rows] = 0.0
+    friction = store.friction[rows]
+    vel -= vel * (friction * dt)[:, None]
+
+    # limit_speed:
+    max_speed = store.max_speed[rows]
+    min_speed = store.min_speed[rows]
+    speed = np.sqrt(vel[:, 0] * vel[:, 0] + vel[:, 1] * vel[:, 1])
+    over = (max_speed > 0) & (speed > max_speed)
+    if over.any():
+        vel[over] *= (1.0 / speed[over])[:, None]
+        vel[over] *= max_speed[over][:, None]
+        speed[over] = np.sqrt(vel[over, 0] * vel[over, 0] + vel[over, 1] * vel[over, 1])
+    vel[(min_speed > 0) & (speed < min_speed)] = 0.0
+
+    store.vel[rows] = vel
+    store.pos[rows] += vel * dt
+    store.version[rows] += 1
+
+def repel_pairs(store: EntityStore, rows_a: np.ndarray, rows_b: np.ndarray, min_distance):
+    'Batch Entity.repel: push rows_a[i] and rows_b[i] apart.'
+    dp = VA(store.pos[rows_a]) - store.pos[rows_b]
+    dir, dist = dp.normal_and_norm()
+    pen = min_distance - dist
+    hit = pen > 0
+    if not hit.any():
+        return
+    force = np.broadcast_to(min_distance, pen.shape)[hit] / pen[hit]
+    force *= 0.99
+    vel = (dir[hit] * force[:, None]).a
+    np.add.at(store.acc, rows_a[hit], vel)
+    np.subtract.at(store.acc, rows_b[hit], vel)
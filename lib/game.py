@@ -1,30 +1,89 @@
 import sys
 import os
+import time
 import random
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 import pygame
 from timer import Duration
-from sprite import Sprite, Rect, V
+from sprite import Sprite, Rect, V, blit_sprites
 from enemy import Enemy
-from bullet import Bullet
+from bullet import Bullet, BulletIndex
 from player import Player
-from cpu import CPU, Program
+from cpu import CPU, program_registry
+from cpu_pool import CPUPool
+import numpy as np
+from entity_store import EntityStore, integrate, repel_pairs
+from spatial_hash import SpatialHash
+from scripted_input import ScriptedInput, NO_KEYS
+from profiler import FrameProfiler
+from pool import EntityPool
+from entity_list import EntityList
+from renderer import DirtyRectRenderer
 from functools import cached_property
 import pdb # ; pdb.set_trace()
 
-# Collision detection function
-def check_collision(rect1, rect2):
-    return pygame.Rect(rect1.as_tuple()).colliderect(pygame.Rect(rect2.as_tuple()))
+# Window events after which the display must be fully redrawn.
+REDRAW_EVENTS = (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED)
+
+def sweep_aabb(x, y, dx, dy, hx, hy):
+    '''
+    First t in [0, 1] at which the point (x, y) + t * (dx, dy) is inside
+    the box of half size (hx, hy) centered on the origin, or None.
+    '''
+    t0, t1 = 0.0, 1.0
+    for p, d, h in ((x, dx, hx), (y, dy, hy)):
+        if d == 0.0:
+            if p <= - h or h <= p:
+                return None
+            continue
+        ta, tb = (- h - p) / d, (h - p) / d
+        if ta > tb:
+            ta, tb = tb, ta
+        if ta > t0:
+            t0 = ta
+        if tb < t1:
+            t1 = tb
+        if t0 >= t1:
+            return None
+    return t0
 
 class Game():
     def __init__(self):
-        self.enemies: list = []
-        self.bullets: list = []
+        self.store: EntityStore = EntityStore()
+        self.cpu_pool: CPUPool = CPUPool(self.store)
+        self.enemies: EntityList = EntityList()
+        self.bullets: EntityList = EntityList()
+        self.bullet_index: BulletIndex = BulletIndex()
         self.player: Player = None
         self.screen = None
         self.clock = None
         self.frame_rate = 60
+        # Simulation runs at sim_rate Hz whatever the frame rate;
+        # at most max_steps are run to catch up after a slow frame.
+        self.sim_rate = 60
+        self.max_steps = 5
+        self.accumulator = 0.0
         self.dt = self.t0_ms = self.t1_ms = None
+        self.headless = False
+        self.random = random.Random()
+        self.time_ms = 0.0
+        self.frame = 0
+        self.events = []
+        self.keys_pressed = NO_KEYS
+        self.profiler = FrameProfiler()
+        self.show_profiler = False
+        self.profile_csv = None
+        self.font = None
+        # Worker processes running the enemies (see sharded.py), 0: none.
+        self.shards = 0
+        self.shard_capacity = 1 << 16
+        # replay.Recorder logging each frame's input, if recording.
+        self.recorder = None
+        # trajectory.TrajectoryWriter logging every step, if any.
+        self.trajectory = None
+        # Redraw only changed regions instead of filling and flipping.
+        self.dirty_rects = True
+        self.renderer = None
 
     @cached_property
     def screen_size(self):
@@ -38,24 +97,38 @@ class Game():
     def enemy_bounds(self):
         return Rect(- self.screen_size, self.screen_size * 3)
 
-    def init(self):
-        # Initialize PyGame
-        pygame.init()
+    def init(self, headless: bool = False, seed = None, shards: int = 0):
+        '''
+        headless: no display or clock, drive with run_headless().
+        shards: run the enemies in this many worker processes.
+        '''
+        self.headless = headless
+        self.shards = shards
+        if shards:
+            from sharded import SharedEntityStore
+            self.store = SharedEntityStore(self.shard_capacity)
+        if seed is not None:
+            self.seed(seed)
 
         # Set up the game window
         self.screen_width = 800
         self.screen_height = 600
-        flags = 0
-        # flags |= pygame.DOUBLEBUF | pygame.OPENGL
-        # flags |= pygame.RESIZABLE | pygame.SCALED
-        self.screen = pygame.display.set_mode(
-            (self.screen_width, self.screen_height),
-            flags,
-        )
-        pygame.display.set_caption("Simple Shooter Game")
-
-        # Set the frame rate
-        self.clock = pygame.time.Clock()
+        if not headless:
+            # Initialize PyGame
+            pygame.init()
+            flags = 0
+            # flags |= pygame.DOUBLEBUF | pygame.OPENGL
+            # flags |= pygame.RESIZABLE | pygame.SCALED
+            self.screen = pygame.display.set_mode(
+                (self.screen_width, self.screen_height),
+                flags,
+            )
+            pygame.display.set_caption("Simple Shooter Game")
+            if self.dirty_rects:
+                self.renderer = DirtyRectRenderer(self.screen)
+
+            # Set the frame rate
+            self.clock = pygame.time.Clock()
 
         # Player settings
         self.player_size = V(50, 60)
@@ -66,120 +139,296 @@ class Game():
         self.bullet_size = V(5, 10)
         self.bullet_speed = 7 * 100
         self.bullets_max = 10
-        self.bullets = []
+        self.bullets = EntityList()
+        self.bullet_pool = EntityPool(self.new_bullet, self.bullets_max)
 
         # Enemy settings
         self.enemy_width = 50
         self.enemy_height = 60
         self.enemy_speed = self.enemy_width * 1.0
         self.enemies_max = 15
-        self.enemies = []
+        self.enemies = EntityList()
+        self.enemy_pool = EntityPool(self.new_enemy, self.enemies_max)
+        self.enemy_grid = SpatialHash(max(self.enemy_width, self.enemy_height))
+        self.enemy_neighbors = SpatialHash(self.enemy_width)
 
         # Spawn an enemy every 2 seconds
         self.enemy_timer = 0
         self.enemy_spawn_time = 4000
 
+        if shards:
+            from sharded import ShardedPool
+            self.cpu_pool = ShardedPool(self, shards)
+            if seed is not None:
+                self.cpu_pool.seed(seed)
+
+    def close(self):
+        'Stop recording, shard workers and free shared memory, if any.'
+        if self.recorder:
+            self.recorder.close()
+        if self.trajectory:
+            self.trajectory.close()
+        if self.shards:
+            self.cpu_pool.close()
+            self.store.close()
+
     #############################################################
 
     def run(self):
         # Main game loop
         self.t1_ms = pygame.time.get_ticks()
         pygame.time.wait(100)
+        profiler = self.profiler
+        renderer = self.renderer
+        step = 1.0 / self.sim_rate
         while True:
+            profiler.begin_frame()
             self.t0_ms = self.t1_ms
             self.t1_ms = pygame.time.get_ticks()
-            self.dt = (self.t1_ms - self.t0_ms) / 1000.0
+            self.accumulator += (self.t1_ms - self.t0_ms) / 1000.0
 
             self.events = list(pygame.event.get())
             self.keys_pressed = pygame.key.get_pressed()
-
-            for event in self.events:
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                # Create a bullet at the current player position
-                if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                    self.player_shoot(self.player)
-
-            # Move players, etc.
-            self.tick()
-
-            # Fill the screen with black
-            self.screen.fill((0, 0, 0))
-
-            # Draw characters:
-            self.draw()
+            self.handle_events(self.events)
+            profiler.lap('input')
+
+            # Move players, etc. in fixed steps:
+            steps = 0
+            while self.accumulator >= step:
+                if steps == self.max_steps:
+                    # Drop the backlog rather than spiral.
+                    self.accumulator = 0.0
+                    break
+                self.dt = step
+                self.tick()
+                self.accumulator -= step
+                steps += 1
+            if self.recorder:
+                self.recorder.record(self, steps, self.t1_ms - self.t0_ms)
+
+            # Clear what was drawn last frame, or fill the screen with black
+            if renderer:
+                renderer.begin()
+            else:
+                self.screen.fill((0, 0, 0))
+
+            # Draw characters between the last two steps:
+            self.draw(self.accumulator / step)
+            if self.show_profiler:
+                self.draw_profiler()
+            profiler.lap('draw')
 
             # Update the display
-            pygame.display.flip()
+            if renderer:
+                renderer.end()
+            else:
+                pygame.display.flip()
+            profiler.lap('flip')
 
             # Cap the frame rate at 60 FPS
             self.clock.tick(self.frame_rate)
+            profiler.lap('wait')
+            profiler.end_frame()
+
+    def run_headless(self, frames: int, dt: Duration = None, input: ScriptedInput = None):
+        '''
+        Run frames ticks with a fixed dt (default 1 / sim_rate) and scripted
+        input, no rendering, as fast as possible. Returns frames per second
+        of wall time.
+        '''
+        self.dt = dt or 1.0 / self.sim_rate
+        profiler = self.profiler
+        t0 = time.perf_counter()
+        for _ in range(frames):
+            profiler.begin_frame()
+            if input:
+                self.keys_pressed, self.events = input.frame(self.frame)
+            else:
+                self.keys_pressed, self.events = NO_KEYS, []
+            self.handle_events(self.events)
+            profiler.lap('input')
+            self.tick()
+            profiler.end_frame()
+        elapsed = time.perf_counter() - t0
+        return frames / elapsed if elapsed > 0 else float('inf')
+
+    def handle_events(self, events):
+        for event in events:
+            if event.type == pygame.QUIT:
+                if self.profile_csv:
+                    self.profiler.dump_csv(self.profile_csv)
+                self.close()
+                pygame.quit()
+                sys.exit()
+            # Create a bullet at the current player position
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                self.player_shoot(self.player)
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.show_profiler = not self.show_profiler
+            # The window was uncovered: what is on screen is no longer ours.
+            if event.type in REDRAW_EVENTS and self.renderer:
+                self.renderer.invalidate()
+
+    def draw_profiler(self):
+        if self.font is None:
+            self.font = pygame.font.SysFont(None, 20)
+        rects = self.profiler.draw(self.screen, self.font)
+        if self.renderer:
+            for i, rect in enumerate(rects):
+                self.renderer.add(('profiler', i), rect)
+
+    def seed(self, seed):
+        'Seed every random source the simulation uses.'
+        self.random.seed(seed)
+        self.cpu_pool.seed(seed)
 
     #############################################################
 
     def tick(self):
+        self.frame += 1
+        self.time_ms += self.dt * 1000.0
+        self.store.save_prev()
+        profiler = self.profiler
+
         # Update player position:
         player = self.player
         self.tick_player(player)
         # self.player.think(dt)
+        profiler.lap('player')
 
         # Update bullet positions:
-        for bullet in self.bullets:
-            self.tick_entity(bullet)
-        self.bullets = [bullet for bullet in self.bullets if self.enemy_bounds.contains(bullet.pos)]
+        integrate(self.bullets, self.dt)
+        self.cull(self.bullets)
+        self.bullet_index.update(self.bullets)
+        profiler.lap('bullets')
 
         # Spawn enemy:
-        current_time = pygame.time.get_ticks()
+        current_time = self.time_ms
         if current_time - self.enemy_timer > self.enemy_spawn_time:
             if len(self.enemies) < self.enemies_max:
                 enemy = self.make_enemy()
                 self.enemies.append(enemy)
                 self.enemy_timer = current_time
+        profiler.lap('spawn')
 
         # Update enemy positions and spawn new ones
-        self.enemies_avoid_each_other()
-        for enemy in self.enemies:
-            self.tick_entity(enemy)
-            # enemy.think(dt)
+        if self.shards:
+            # Repulsion, programs and integration all run in the workers.
+            self.cpu_pool.tick(self.dt)
+            profiler.lap('enemies')
+        else:
+            self.enemies_avoid_each_other()
+            profiler.lap('repulsion')
+            self.cpu_pool.tick(self.dt)
+            profiler.lap('enemies')
+            integrate(self.enemies, self.dt)
 
         # Remove enemies that are off the screen
-        self.enemies = [enemy for enemy in self.enemies if self.enemy_bounds.contains(enemy.pos)]
+        self.cull(self.enemies)
+        profiler.lap('integrate')
 
         # Check for collisions
-        for bullet in self.bullets[:]:
-            for enemy in self.enemies[:]:
-                rect_1 = bullet.sprite.rect
-                rect_2 = enemy.sprite.rect
-                if check_collision(rect_1, rect_2):
-                    self.bullets.remove(bullet)
-                    self.enemies.remove(enemy)
-                    break
+        self.collide_bullets_enemies()
+
+        # Apply this frame's removals
+        self.bullets.flush()
+        self.enemies.flush()
+        profiler.lap('collisions')
+
+        if self.trajectory:
+            self.trajectory.write(self)
+            profiler.lap('trajectory')
+
+    def collide_bullets_enemies(self):
+        '''
+        Each bullet destroys the first enemy it touches during this step.
+
+        Boxes are swept from prev_pos to pos, so a fast bullet cannot
+        pass through an enemy between two steps: in the enemy's frame the
+        bullet center moves along a segment, tested against the enemy box
+        grown by the bullet's half size.
+        '''
+        bullets, enemies = self.bullets, self.enemies
+        if not bullets or not enemies:
+            return
+        grid = self.enemy_grid
+        grid.clear()
+        moves = self.moves(enemies)
+        for enemy, (x0, y0, x1, y1, hx, hy) in moves.items():
+            grid.insert(enemy, min(x0, x1) - hx, min(y0, y1) - hy, max(x0, x1) + hx, max(y0, y1) + hy)
+        for bullet, (bx0, by0, bx1, by1, bhx, bhy) in self.moves(bullets).items():
+            hit, hit_t = None, 2.0
+            for enemy in grid.candidates(min(bx0, bx1) - bhx, min(by0, by1) - bhy, max(bx0, bx1) + bhx, max(by0, by1) + bhy):
+                ex0, ey0, ex1, ey1, ehx, ehy = moves[enemy]
+                x, y = bx0 - ex0, by0 - ey0
+                t = sweep_aabb(x, y, bx1 - ex1 - x, by1 - ey1 - y, bhx + ehx, bhy + ehy)
+                if t is not None and t < hit_t:
+                    hit, hit_t = enemy, t
+            if hit is not None:
+                grid.remove(hit)
+                bullets.remove(bullet)
+                enemies.remove(hit)
+
+    def moves(self, entities):
+        'entity -> (prev x, prev y, x, y, half width, half height) for this step.'
+        rows = self.store.rows(entities)
+        prev = self.store.prev_pos[rows].tolist()
+        pos = self.store.pos[rows].tolist()
+        return {
+            entity: (x0, y0, x1, y1, entity.sprite.size.x * 0.5, entity.sprite.size.y * 0.5)
+            for entity, (x0, y0), (x1, y1) in zip(entities, prev, pos)
+        }
+
+    def cull(self, entities: EntityList):
+        'Remove entities outside enemy_bounds, at the next flush.'
+        bounds = self.enemy_bounds
+        for entity in entities:
+            if not bounds.contains(entity.pos):
+                entities.remove(entity)
 
     def enemies_avoid_each_other(self):
-        # moved = []
-        i = 0
-        for e1 in self.enemies:
-            i += 1
-            for e2 in self.enemies[i:]:
-                r = e2.sprite.width
-                e2.repel(e1, r)
+        'Repel enemies closer than one sprite width.'
+        if len(self.enemies) < 2:
+            return
+        r = self.enemy_width
+        grid = self.enemy_neighbors
+        grid.clear()
+        rows = self.store.rows(self.enemies)
+        for row, (x, y) in zip(rows.tolist(), self.store.pos[rows].tolist()):
+            grid.insert_point(row, x, y)
+        rows_a, rows_b = grid.pairs_within(r)
+        if rows_a:
+            repel_pairs(self.store, np.array(rows_a), np.array(rows_b), r)
 
     #############################################################
 
-    def draw(self):
-        screen = self.screen
+    def draw(self, alpha: float = 1.0):
+        'alpha: how far between the previous and current step to draw.'
+        pos = self.store.interpolated(alpha)
 
         # Draw the bullets
-        for bullet in self.bullets:
-            bullet.draw(screen)
+        self.draw_batch(self.bullets, pos)
 
         # Draw the player
-        self.player.draw(screen)
+        player_pos = V(*pos[self.player.row])
+        if self.renderer:
+            self.renderer.draw(self.player, player_pos)
+        else:
+            self.player.draw(self.screen, player_pos)
 
         # Draw the enemies
-        for enemy in self.enemies:
-            enemy.draw(screen)
+        self.draw_batch(self.enemies, pos)
+
+    def draw_batch(self, entities, pos):
+        'Blit entities centered at their rows of pos in one call.'
+        if not entities:
+            return
+        sprites = [entity.sprite for entity in entities]
+        centers = pos[self.store.rows(entities)].tolist()
+        if self.renderer:
+            self.renderer.blits(entities, sprites, centers)
+        else:
+            blit_sprites(self.screen, sprites, centers)
 
     #############################################################
 
@@ -215,12 +464,15 @@ class Game():
         pos = V(player.pos.x, player.rect.top)
         vel = V(0.0, - self.bullet_speed)
         vel += V(0.0, player.vel.y * 0.5)
-        color = (255, 255, 255)
-        sprite = Sprite(self.bullet_size, color)
-        bullet = Bullet(pos, vel, sprite, game=self)
+        bullet = self.bullet_pool.acquire(pos, vel)
         self.bullets.append(bullet)
         return bullet
 
+    def new_bullet(self, pos: V, vel: V):
+        color = (255, 255, 255)
+        sprite = Sprite(self.bullet_size, color)
+        return Bullet(pos, vel, sprite, store=self.store, game=self)
+
     def tick_entity(self, entity):
         'Tick entity behavior.'
         entity.dt = self.dt
@@ -236,6 +488,7 @@ class Game():
         sprite = Sprite(self.player_size, color)
         player = Player(
             pos, vel, sprite,
+            store=self.store,
             quickness=self.player_thrust,
             friction=7.0,
             min_speed=0.0001,
@@ -245,28 +498,38 @@ class Game():
         return player
 
     def make_enemy(self):
-        enemy_x = random.randint(self.enemy_width, self.screen_width - self.enemy_width)
+        enemy_x = self.random.randint(self.enemy_width, self.screen_width - self.enemy_width)
         enemy_y = - self.enemy_height
+        enemy = self.enemy_pool.acquire(V(enemy_x, enemy_y), V(0.0, self.enemy_speed))
+        self.cpu_pool.add(enemy.cpu)
+        return enemy
+
+    def new_enemy(self, pos: V, vel: V):
         enemy_color = (255, 0, 0)
         sprite = Sprite(
             V(self.enemy_width, self.enemy_height),
             enemy_color,
         )
-        enemy = Enemy(
-            V(enemy_x, enemy_y),
-            V(0.0, self.enemy_speed),
+        return Enemy(
+            pos,
+            vel,
             sprite,
+            store=self.store,
             player=self.player,
-            programs=self.make_enemy_programs(),
+            programs=self.enemy_programs,
             max_speed=self.enemy_speed * 4,
             friction=0.2,
             game=self,
         )
-        return enemy
+
+    @cached_property
+    def enemy_programs(self):
+        'Compiled once per process by program_registry; every enemy shares them.'
+        return self.make_enemy_programs()
 
     def make_enemy_programs(self):
         programs = [
-            Program(
+            program_registry.define(
                 'randomize_direction',
                 [
                     # Accelerate random X direction:
@@ -287,7 +550,7 @@ class Game():
                     ('repeat'),
                 ],
             ),
-            Program(
+            program_registry.define(
                 'avoid_bullets',
                 [
                     ('const', V(2.0, 2.0)),
@@ -297,7 +560,7 @@ class Game():
                     ('repeat'),
                 ]
             ),
-            Program(
+            program_registry.define(
                 'move_toward_player',
                 [
                     ('const', V(0.2, 0.9)),
@@ -319,6 +582,44 @@ class Game():
         return programs
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', action='store_true', help='simulate without a display')
+    parser.add_argument('--frames', type=int, default=10000, help='frames to simulate when headless')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--sim-rate', type=int, default=60, help='simulation steps per second')
+    parser.add_argument('--profile', action='store_true', help='show the frame profiler overlay (toggle with F3)')
+    parser.add_argument('--profile-csv', metavar='PATH', help='write per-frame phase times on exit')
+    parser.add_argument('--full-redraw', action='store_true', help='fill and flip the whole screen every frame')
+    parser.add_argument('--shards', type=int, default=0, help='run enemies in this many worker processes')
+    parser.add_argument('--record', metavar='PATH', help='record input for replay.py (picks a seed if none given)')
+    parser.add_argument('--trajectory', metavar='PREFIX', help='log every entity\'s position and velocity each step to PREFIX.*.traj')
+    parser.add_argument('--trajectory-chunk', type=int, default=1 << 20, metavar='N', help='records per trajectory file')
+    args = parser.parse_args()
+    if args.record and args.headless:
+        parser.error('--record records live input; it cannot be used with --headless')
+    if args.record and args.seed is None:
+        args.seed = random.randrange(1 << 62)
+
     game = Game()
-    game.init()
-    game.run()
+    game.sim_rate = args.sim_rate
+    game.dirty_rects = not args.full_redraw
+    game.init(headless=args.headless, seed=args.seed, shards=args.shards)
+    game.show_profiler = args.profile
+    if args.record:
+        from replay import Recorder
+        game.recorder = Recorder(args.record, args.seed, game.sim_rate)
+    if args.trajectory:
+        from trajectory import TrajectoryWriter
+        game.trajectory = TrajectoryWriter(args.trajectory, args.trajectory_chunk)
+    game.profile_csv = args.profile_csv
+    if args.headless:
+        fps = game.run_headless(args.frames)
+        print(f"{args.frames} frames, {fps:.0f} frames/s, {len(game.enemies)} enemies, {len(game.bullets)} bullets")
+        if args.profile:
+            print('\n'.join(game.profiler.summary()))
+        if args.profile_csv:
+            game.profiler.dump_csv(args.profile_csv)
+        game.close()
+    else:
+        game.run()
@@ -1,6 +1,8 @@
 from entity import Entity
 
 class Player(Entity):
+    KIND = 1
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
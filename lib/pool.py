@@ -0,0 +1,36 @@
+class EntityPool:
+    '''
+    Free list of released entities of one kind.
+
+    acquire() resets and returns a released entity, or makes a new one
+    with factory(pos, vel) when none is free. Entity.release() puts
+    pooled entities back; at most capacity of them are kept for reuse.
+    '''
+    def __init__(self, factory, capacity: int):
+        self.factory = factory
+        self.capacity = capacity
+        self.free: list = []
+        self.created = 0
+        self.reused = 0
+
+    def __repr__(self):
+        return f"{type(self).__name__}(free={len(self.free)}, capacity={self.capacity}, created={self.created}, reused={self.reused})"
+
+    def __len__(self):
+        return len(self.free)
+
+    def acquire(self, pos, vel):
+        if self.free:
+            entity = self.free.pop()
+            entity.reset(pos, vel)
+            self.reused += 1
+        else:
+            entity = self.factory(pos, vel)
+            entity.pool = self
+            self.created += 1
+        return entity
+
+    def put(self, entity):
+        'Called by Entity.release().'
+        if len(self.free) < self.capacity:
+            self.free.append(entity)
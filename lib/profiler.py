@@ -0,0 +1,101 @@
+import csv
+import time
+import numpy as np
+
+PHASES = (
+    'input', 'player', 'bullets', 'spawn', 'repulsion', 'enemies',
+    'integrate', 'collisions', 'trajectory', 'draw', 'flip', 'wait',
+)
+
+class FrameProfiler:
+    '''
+    Wall time per frame phase, kept for the last `size` frames.
+
+    Call begin_frame(), then lap(phase) at the end of each phase: the
+    time since the previous lap is charged to that phase.
+    '''
+    def __init__(self, phases = PHASES, size: int = 600):
+        self.phases = tuple(phases)
+        self.index = {phase: i for i, phase in enumerate(self.phases)}
+        self.size = size
+        self.times = np.zeros((size, len(self.phases)))
+        self.frames = 0
+        self.row = 0
+        self.enabled = True
+        self._t = time.perf_counter()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(frames={self.frames}, size={self.size}, enabled={self.enabled})"
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.row = self.frames % self.size
+        self.times[self.row] = 0.0
+        self._t = time.perf_counter()
+
+    def lap(self, phase: str):
+        if not self.enabled:
+            return
+        t = time.perf_counter()
+        self.times[self.row, self.index[phase]] += t - self._t
+        self._t = t
+
+    def end_frame(self):
+        if self.enabled:
+            self.frames += 1
+
+    def recorded(self) -> np.ndarray:
+        'Phase times of the recorded frames, oldest first, in seconds.'
+        n = min(self.frames, self.size)
+        if self.frames <= self.size:
+            return self.times[:n]
+        start = self.frames % self.size
+        return np.concatenate((self.times[start:], self.times[:start]))
+
+    def frame_times(self) -> np.ndarray:
+        return self.recorded().sum(axis=1)
+
+    def percentiles(self, qs = (50, 95, 99)) -> dict:
+        'Rolling frame time percentiles in ms, e.g. {"p50": 4.1, ...}.'
+        times = self.frame_times()
+        if not len(times):
+            return {f"p{q}": 0.0 for q in qs}
+        values = np.percentile(times, qs) * 1000.0
+        return {f"p{q}": float(v) for q, v in zip(qs, values)}
+
+    def phase_percentiles(self, q = 95) -> dict:
+        'Per phase q-th percentile in ms.'
+        times = self.recorded()
+        if not len(times):
+            return {phase: 0.0 for phase in self.phases}
+        values = np.percentile(times, q, axis=0) * 1000.0
+        return dict(zip(self.phases, values.tolist()))
+
+    def summary(self) -> list:
+        'Lines of text: frame percentiles, then p95 of each phase that took time.'
+        p = self.percentiles()
+        lines = [f"frame ms p50 {p['p50']:.2f} p95 {p['p95']:.2f} p99 {p['p99']:.2f}"]
+        for phase, ms in self.phase_percentiles(95).items():
+            if ms > 0:
+                lines.append(f"{phase:<10} p95 {ms:6.2f}")
+        return lines
+
+    def dump_csv(self, path):
+        'One row per recorded frame, times in ms.'
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('frame',) + self.phases + ('total',))
+            first = self.frames - min(self.frames, self.size)
+            for i, row in enumerate(self.recorded() * 1000.0):
+                writer.writerow([first + i] + [f"{ms:.4f}" for ms in row] + [f"{row.sum():.4f}"])
+
+    def draw(self, screen, font, pos = (8, 8), color = (255, 255, 0)):
+        'Render summary() as an overlay; returns the rects drawn.'
+        x, y = pos
+        rects = []
+        for line in self.summary():
+            surface = font.render(line, True, color)
+            rects.append(screen.blit(surface, (x, y)))
+            y += surface.get_height()
+        return rects
@@ -0,0 +1,80 @@
+import pygame
+from sprite import BLACK, blit_sprites
+
+class DirtyRectRenderer:
+    '''
+    Redraws only the screen regions that changed since the last frame.
+
+    begin() paints the background over everything drawn last frame,
+    draw() / add() record what is drawn this frame under a key, and
+    end() pushes the union of each key's old and new rect to the display
+    with pygame.display.update(rects) instead of a full flip.
+    '''
+    def __init__(self, screen, background: tuple = BLACK, max_rects: int = 200):
+        self.screen = screen
+        self.background = background
+        # Past this many dirty rects a single full update is cheaper.
+        self.max_rects = max_rects
+        self.prev: dict = {}
+        self.current: dict = {}
+        self.full = True
+
+    def __repr__(self):
+        return f"{type(self).__name__}(rects={len(self.prev)}, max_rects={self.max_rects})"
+
+    def invalidate(self):
+        'Repaint and update the whole screen on the next frame.'
+        self.full = True
+
+    def begin(self):
+        screen, background = self.screen, self.background
+        if self.full:
+            screen.fill(background)
+        else:
+            for rect in self.prev.values():
+                screen.fill(background, rect)
+        self.current = {}
+
+    def add(self, key, rect: pygame.Rect):
+        'Record a region drawn this frame.'
+        self.current[key] = rect
+
+    def draw(self, entity, pos = None):
+        'Draw entity centered at pos (default its own) and record its rect.'
+        sprite = entity.sprite
+        if pos is None:
+            pos = sprite.pos
+        self.blits((entity,), (sprite,), ((pos.x, pos.y),))
+
+    def blits(self, keys, sprites, centers):
+        'Batch version of draw(): blit sprites at centers, record rects under keys.'
+        rects = blit_sprites(self.screen, sprites, centers, True)
+        current = self.current
+        for key, rect in zip(keys, rects):
+            current[key] = rect
+
+    def end(self):
+        'Update the changed regions of the display; returns them.'
+        prev, current = self.prev, self.current
+        self.prev = current
+        if self.full:
+            self.full = False
+            pygame.display.flip()
+            return [self.screen.get_rect()]
+        dirty = []
+        for key, rect in current.items():
+            old = prev.pop(key, None)
+            if old is None:
+                dirty.append(rect)
+            elif old.colliderect(rect):
+                dirty.append(rect.union(old))
+            else:
+                dirty.append(rect)
+                dirty.append(old)
+        # Whatever is left was drawn last frame only.
+        dirty.extend(prev.values())
+        if len(dirty) > self.max_rects:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
+        return dirty
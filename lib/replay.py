@@ -0,0 +1,168 @@
+'''
+Record a game's inputs and replay them headless, checking for divergence.
+
+    PYTHONPATH=lib python3 -m game --record run.rec
+    PYTHONPATH=lib python3 -m replay run.rec
+
+A recording is a header (seed, sim_rate, tracked keys) and one fixed-size
+record per displayed frame: wall time since the last frame, how many
+simulation steps ran, the tracked keys held, shots fired and a hash of
+the simulation state after the frame. Replaying runs the same steps with
+the same inputs as fast as possible and reports the first frame whose
+hash differs.
+'''
+import sys
+import time
+import struct
+import hashlib
+import pygame
+from scripted_input import KeyState
+
+MAGIC = b'GREC'
+VERSION = 1
+HEADER = struct.Struct('<4sHqHB')
+# dt_ms, steps, keys bitmask, shots, state hash
+FRAME = struct.Struct('<HBBBQ')
+
+KEYS = (pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s)
+
+def state_hash(game) -> int:
+    'Hash of frame number, positions and velocities of the player, bullets and enemies.'
+    store = game.store
+    rows = store.rows([game.player, *game.bullets, *game.enemies])
+    h = hashlib.blake2b(digest_size=8)
+    h.update(struct.pack('<q', game.frame))
+    h.update(store.pos[rows].tobytes())
+    h.update(store.vel[rows].tobytes())
+    return int.from_bytes(h.digest(), 'little')
+
+def shots_in(events) -> int:
+    return sum(1 for event in events if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE)
+
+class Recorder:
+    'Writes one record per Game.run frame; see Game.recorder.'
+    def __init__(self, path, seed: int, sim_rate: int, keys = KEYS):
+        self.keys = tuple(keys)
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, sim_rate, len(self.keys)))
+        self.file.write(struct.pack(f"<{len(self.keys)}i", *self.keys))
+        self.frames = 0
+
+    def __repr__(self):
+        return f"{type(self).__name__}(file={self.file.name!r}, frames={self.frames})"
+
+    def record(self, game, steps: int, dt_ms: int):
+        pressed = game.keys_pressed
+        mask = 0
+        for bit, key in enumerate(self.keys):
+            if pressed[key]:
+                mask |= 1 << bit
+        shots = shots_in(game.events)
+        self.file.write(FRAME.pack(min(dt_ms, 0xffff), steps, mask, min(shots, 0xff), state_hash(game)))
+        self.frames += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+class Recording:
+    'A recording read back: header fields and a list of frame tuples.'
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, self.seed, self.sim_rate, nkeys = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a recording")
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported recording version {version}")
+        offset = HEADER.size
+        self.keys = struct.unpack_from(f"<{nkeys}i", data, offset)
+        offset += 4 * nkeys
+        # A crash can leave a partial last record.
+        end = offset + (len(data) - offset) // FRAME.size * FRAME.size
+        self.frames = list(FRAME.iter_unpack(data[offset:end]))
+
+    def __repr__(self):
+        return f"{type(self).__name__}(seed={self.seed}, sim_rate={self.sim_rate}, frames={len(self.frames)})"
+
+    def __len__(self):
+        return len(self.frames)
+
+    def key_state(self, mask: int) -> KeyState:
+        return KeyState(key for bit, key in enumerate(self.keys) if mask >> bit & 1)
+
+def replay(recording: Recording, game = None, stop_on_divergence: bool = True) -> dict:
+    '''
+    Feed recording into game (default: a new headless Game seeded from the
+    recording) and run its steps without a display.
+    Returns frames, steps, wall time, steps per second and the first
+    divergent frame (None if every hash matched).
+    '''
+    if game is None:
+        from game import Game
+        game = Game()
+        game.sim_rate = recording.sim_rate
+        game.init(headless=True, seed=recording.seed)
+    step = 1.0 / recording.sim_rate
+    shoot = pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE)
+    key_states = {}
+    profiler = game.profiler
+    divergence = None
+    steps = frames = 0
+    t0 = time.perf_counter()
+    for frame, (dt_ms, n, mask, shots, expected) in enumerate(recording.frames):
+        profiler.begin_frame()
+        keys = key_states.get(mask)
+        if keys is None:
+            keys = key_states[mask] = recording.key_state(mask)
+        game.keys_pressed = keys
+        game.events = [shoot] * shots
+        game.handle_events(game.events)
+        profiler.lap('input')
+        for _ in range(n):
+            game.dt = step
+            game.tick()
+        profiler.end_frame()
+        steps += n
+        frames += 1
+        if divergence is None and state_hash(game) != expected:
+            divergence = frame
+            if stop_on_divergence:
+                break
+    elapsed = time.perf_counter() - t0
+    return {
+        'frames': frames,
+        'steps': steps,
+        'seconds': elapsed,
+        'steps_per_s': steps / elapsed if elapsed > 0 else float('inf'),
+        'recorded_seconds': sum(frame[0] for frame in recording.frames[:frames]) / 1000.0,
+        'divergence': divergence,
+    }
+
+def main(argv = None):
+    import argparse
+    import logging
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path')
+    parser.add_argument('--keep-going', action='store_true', help='run to the end after a divergence')
+    parser.add_argument('--profile', action='store_true', help='print frame phase percentiles')
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    recording = Recording(args.path)
+    from game import Game
+    game = Game()
+    game.sim_rate = recording.sim_rate
+    game.init(headless=True, seed=recording.seed)
+    result = replay(recording, game, not args.keep_going)
+    print(f"{recording!r}: {result['frames']} frames, {result['steps']} steps in {result['seconds']:.2f} s "
+          f"({result['steps_per_s']:.0f} steps/s; recorded {result['recorded_seconds']:.1f} s)")
+    if args.profile:
+        print('\n'.join(game.profiler.summary()))
+    if result['divergence'] is not None:
+        print(f"diverged at frame {result['divergence']}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,44 @@
+from bisect import bisect_right
+import pygame
+
+class KeyState:
+    'Stand-in for pygame.key.get_pressed(): indexable by key code.'
+    def __init__(self, pressed = ()):
+        self.pressed = frozenset(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+    def __repr__(self):
+        return f"{type(self).__name__}({sorted(self.pressed)!r})"
+
+NO_KEYS = KeyState()
+
+class ScriptedInput:
+    '''
+    Per-frame input for headless runs.
+
+    keys maps a frame number to the keys held from that frame on;
+    shots lists the frames on which the player presses space.
+    '''
+    def __init__(self, keys: dict = None, shots = ()):
+        keys = keys or {}
+        self.frames = sorted(keys)
+        self.key_states = [KeyState(keys[frame]) for frame in self.frames]
+        self.shots = frozenset(shots)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(key_changes={len(self.frames)}, shots={len(self.shots)})"
+
+    def keys_at(self, frame: int) -> KeyState:
+        i = bisect_right(self.frames, frame)
+        return self.key_states[i - 1] if i else NO_KEYS
+
+    def events_at(self, frame: int) -> list:
+        if frame in self.shots:
+            return [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE)]
+        return []
+
+    def frame(self, frame: int):
+        'Return (keys_pressed, events) for frame.'
+        return self.keys_at(frame), self.events_at(frame)
@@ -0,0 +1,300 @@
+'''
+Enemy simulation split across worker processes.
+
+The EntityStore lives in shared memory. The screen is cut into vertical
+strips, one per worker; a worker owns the enemies whose x lies in its
+strip and, each tick, repels them from each other, runs their programs
+and integrates them, writing straight into the shared arrays. The main
+process repels pairs that straddle a strip border beforehand and hands
+enemies that crossed a border to their new worker.
+'''
+import atexit
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from vector2d import V
+from sprite import Sprite
+from entity import Entity
+from enemy import Enemy
+from bullet import BulletIndex
+from cpu import CPU
+from cpu_pool import CPUPool
+from entity_store import EntityStore, integrate_rows, repel_pairs
+from spatial_hash import SpatialHash
+
+class SharedEntityStore(EntityStore):
+    '''
+    EntityStore whose columns are backed by shared memory blocks, so
+    other processes can attach to the same arrays. Capacity is fixed.
+    '''
+    def __init__(self, capacity: int = 1 << 16, names: dict = None):
+        'names: attach to the blocks of an existing store (see spec()).'
+        self.capacity = capacity
+        self.size = 0
+        self.free_rows: list = []
+        self.owner = names is None
+        self.blocks: dict = {}
+        template = EntityStore(0)
+        for name in self.COLUMNS:
+            column = getattr(template, name)
+            shape = (capacity,) + column.shape[1:]
+            nbytes = max(int(np.prod(shape)) * column.dtype.itemsize, 1)
+            if names is None:
+                block = SharedMemory(create=True, size=nbytes)
+            else:
+                block = SharedMemory(name=names[name])
+            self.blocks[name] = block
+            array = np.ndarray(shape, dtype=column.dtype, buffer=block.buf)
+            if names is None:
+                array[:] = 0
+            setattr(self, name, array)
+        if self.owner:
+            atexit.register(self.close)
+
+    def spec(self):
+        'Arguments for attaching from another process.'
+        return self.capacity, {name: block.name for name, block in self.blocks.items()}
+
+    def grow(self, capacity: int):
+        if capacity > self.capacity:
+            raise MemoryError(f"{self!r}: shared store is full")
+
+    def close(self):
+        'Drop the arrays and the blocks; the owner also unlinks them.'
+        if not self.blocks:
+            return
+        for name in self.COLUMNS:
+            setattr(self, name, None)
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+
+#############################################################
+
+class ShardView:
+    'What worker-side enemies see of the game.'
+    def __init__(self):
+        self.bullets: list = []
+        self.bullet_index = BulletIndex()
+
+class ShardWorker:
+    'One strip of enemies, run inside a worker process.'
+    def __init__(self, store: SharedEntityStore, index: int, edges: np.ndarray, programs, enemy_size: V, r: float, player_row: int):
+        self.store = store
+        self.index = index
+        self.edges = edges
+        self.programs = programs
+        self.enemy_size = enemy_size
+        self.r = r
+        self.pool = CPUPool(store)
+        self.cpus: dict = {}
+        self.view = ShardView()
+        self.player = Entity.attach(store, player_row, Sprite(V()))
+        self.bullet_handles: dict = {}
+        self.grid = SpatialHash(r)
+
+    def apply(self, ops):
+        for op in ops:
+            if op[0] == 'add':
+                _, row, states = op
+                enemy = Enemy.attach(self.store, row, Sprite(self.enemy_size), game=self.view, player=self.player)
+                cpu = enemy.cpu = CPU(enemy, self.programs)
+                for thread, state in zip(cpu.threads, states):
+                    thread.set_state(state)
+                self.pool.add(cpu)
+                self.cpus[row] = cpu
+            elif op[0] == 'remove':
+                self.pool.remove(self.cpus.pop(op[1]))
+            elif op[0] == 'seed':
+                self.pool.seed(op[1])
+
+    def bullet(self, row: int):
+        handle = self.bullet_handles.get(row)
+        if handle is None:
+            handle = self.bullet_handles[row] = Entity.attach(self.store, row, Sprite(V()))
+        return handle
+
+    def tick(self, ops, dt: float, bullet_rows: np.ndarray):
+        'Returns [(row, thread states)] of the enemies that left the strip.'
+        self.apply(ops)
+        self.view.bullets = [self.bullet(row) for row in bullet_rows.tolist()]
+        self.view.bullet_index.update(self.view.bullets)
+        store = self.store
+        rows = np.fromiter(self.cpus, dtype=np.intp, count=len(self.cpus))
+        if not len(rows):
+            self.pool.tick(dt)
+            return []
+        self.repel(rows)
+        self.pool.tick(dt)
+        integrate_rows(store, rows, dt)
+        strip = np.searchsorted(self.edges, store.pos[rows, 0], side='right')
+        leaving = []
+        for row in rows[strip != self.index].tolist():
+            cpu = self.cpus.pop(row)
+            self.pool.remove(cpu)
+            leaving.append((row, [thread.get_state() for thread in cpu.threads]))
+        return leaving
+
+    def repel(self, rows: np.ndarray):
+        'Game.enemies_avoid_each_other, for the pairs inside this strip.'
+        if len(rows) < 2:
+            return
+        grid = self.grid
+        grid.clear()
+        for row, (x, y) in zip(rows.tolist(), self.store.pos[rows].tolist()):
+            grid.insert_point(row, x, y)
+        rows_a, rows_b = grid.pairs_within(self.r)
+        if rows_a:
+            repel_pairs(self.store, np.array(rows_a), np.array(rows_b), self.r)
+
+    def states(self, ops) -> dict:
+        self.apply(ops)
+        self.pool.sync()
+        return {row: [thread.get_state() for thread in cpu.threads] for row, cpu in self.cpus.items()}
+
+def shard_main(conn, spec, *args):
+    'Worker process loop: answer tick and sync messages until stop.'
+    store = SharedEntityStore(*spec)
+    worker = ShardWorker(store, *args)
+    try:
+        while True:
+            msg = conn.recv()
+            try:
+                if msg[0] == 'tick':
+                    conn.send(worker.tick(*msg[1:]))
+                elif msg[0] == 'sync':
+                    conn.send(worker.states(*msg[1:]))
+                elif msg[0] == 'stop':
+                    break
+            except Exception as e:
+                conn.send(e)
+                raise
+    finally:
+        worker = None
+        store.close()
+        conn.close()
+
+#############################################################
+
+class ShardedPool:
+    '''
+    Stands in for Game.cpu_pool: enemies added here are run by one worker
+    process per strip of the screen. tick() also does the enemies'
+    repulsion and integration, which Game.tick skips when sharded.
+
+    Adds and removes are queued and sent with the next tick.
+    '''
+    def __init__(self, game, shards: int):
+        assert isinstance(game.store, SharedEntityStore)
+        self.game = game
+        self.store = game.store
+        width = game.screen_width
+        self.edges = np.array([width * i / shards for i in range(1, shards)])
+        self.r = game.enemy_width
+        self.cpus: dict = {}
+        self.owner: dict = {}
+        self.ops = [[] for _ in range(shards)]
+        self.conns = []
+        self.procs = []
+        ctx = multiprocessing.get_context()
+        args = (game.enemy_programs, V(game.enemy_width, game.enemy_height), self.r, game.player.row)
+        for i in range(shards):
+            conn, child = ctx.Pipe()
+            proc = ctx.Process(
+                target=shard_main,
+                args=(child, self.store.spec(), i, self.edges) + args,
+                name=f"shard-{i}",
+                daemon=True,
+            )
+            proc.start()
+            child.close()
+            self.conns.append(conn)
+            self.procs.append(proc)
+        atexit.register(self.close)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(shards={len(self.procs)}, cpus={len(self.cpus)})"
+
+    def __len__(self):
+        return len(self.cpus)
+
+    def shard_of(self, x: float) -> int:
+        return int(np.searchsorted(self.edges, x, side='right'))
+
+    def add(self, cpu: CPU):
+        row = cpu.state.row
+        shard = self.owner[row] = self.shard_of(self.store.pos[row, 0])
+        self.ops[shard].append(('add', row, [thread.get_state() for thread in cpu.threads]))
+        self.cpus[row] = cpu
+        cpu.pool = self
+
+    def remove(self, cpu: CPU):
+        row = cpu.state.row
+        self.ops[self.owner.pop(row)].append(('remove', row))
+        del self.cpus[row]
+        cpu.pool = None
+
+    def seed(self, seed):
+        for i, ops in enumerate(self.ops):
+            ops.append(('seed', None if seed is None else [seed, i]))
+
+    def send(self, *msg):
+        'Send msg with each shard\'s queued ops; return the replies.'
+        for conn, ops in zip(self.conns, self.ops):
+            conn.send((msg[0], ops) + msg[1:])
+        self.ops = [[] for _ in self.conns]
+        replies = [conn.recv() for conn in self.conns]
+        for reply in replies:
+            if isinstance(reply, BaseException):
+                raise RuntimeError('shard worker failed') from reply
+        return replies
+
+    def tick(self, dt: float):
+        self.repel_borders()
+        bullet_rows = self.store.rows(self.game.bullets)
+        for leaving in self.send('tick', dt, bullet_rows):
+            for row, states in leaving:
+                for thread, state in zip(self.cpus[row].threads, states):
+                    thread.set_state(state)
+                shard = self.owner[row] = self.shard_of(self.store.pos[row, 0])
+                self.ops[shard].append(('add', row, states))
+
+    def repel_borders(self):
+        'Repel the pairs closer than r that belong to different shards.'
+        if len(self.owner) < 2 or not len(self.edges):
+            return
+        rows = np.fromiter(self.owner, dtype=np.intp, count=len(self.owner))
+        x = self.store.pos[rows, 0]
+        near = np.abs(x[:, None] - self.edges[None, :]).min(axis=1) < self.r
+        if near.sum() < 2:
+            return
+        grid = SpatialHash(self.r)
+        for row, (x, y) in zip(rows[near].tolist(), self.store.pos[rows[near]].tolist()):
+            grid.insert_point(row, x, y)
+        owner = self.owner
+        pairs = [(a, b) for a, b in zip(*grid.pairs_within(self.r)) if owner[a] != owner[b]]
+        if pairs:
+            rows_a, rows_b = np.array(pairs).T
+            repel_pairs(self.store, rows_a, rows_b, self.r)
+
+    def sync(self):
+        'Copy every worker thread\'s state back to the main process CPUs.'
+        for states in self.send('sync'):
+            for row, thread_states in states.items():
+                for thread, state in zip(self.cpus[row].threads, thread_states):
+                    thread.set_state(state)
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+        for proc in self.procs:
+            proc.join(timeout=5)
+        for conn in self.conns:
+            conn.close()
+        self.conns = []
+        self.procs = []
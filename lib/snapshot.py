@@ -0,0 +1,186 @@
+'''
+Game state as compact bytes, for rollback, crash recovery and forking.
+
+    data = snapshot(game)
+    ...
+    restore(game, data)
+
+The layout is a small JSON header followed by raw numpy arrays: the used
+part of every EntityStore column, the rows of the player, bullets and
+enemies, each CPUPool ProgramBatch's thread arrays (ip, wake time, stack,
+flags), and the game's and the pool's random generators. No object
+graph is pickled. Pooled threads draw random numbers from the pool's
+generator, so Thread._rand is not saved, and the Thread objects
+themselves are left stale (see CPUPool.sync). Take snapshots between
+ticks; the game must use a CPUPool (not sharded).
+'''
+import json
+import struct
+import numpy as np
+from vector2d import V
+
+MAGIC = b'GSNP'
+VERSION = 1
+
+# ProgramBatch columns saved per program, besides the stack.
+THREAD_COLUMNS = ('ip', 'wake_at', 'sp', 'running', 'halted')
+
+def pack(meta: dict, arrays: dict) -> bytes:
+    'Header (magic, version, JSON meta), then each array: name, dtype, shape, data.'
+    meta_bytes = json.dumps(meta).encode()
+    parts = [struct.pack('<4sIII', MAGIC, VERSION, len(arrays), len(meta_bytes)), meta_bytes]
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        name_bytes, dtype_bytes = name.encode(), array.dtype.str.encode()
+        parts.append(struct.pack('<BBB', len(name_bytes), len(dtype_bytes), array.ndim))
+        parts.append(name_bytes)
+        parts.append(dtype_bytes)
+        parts.append(struct.pack(f"<{array.ndim}q", *array.shape))
+        parts.append(array.tobytes())
+    return b''.join(parts)
+
+def unpack(data: bytes):
+    'Returns (meta, arrays); arrays are read-only views into data.'
+    magic, version, count, meta_len = struct.unpack_from('<4sIII', data)
+    if magic != MAGIC:
+        raise ValueError('not a game snapshot')
+    if version != VERSION:
+        raise ValueError(f"unsupported snapshot version {version}")
+    offset = struct.calcsize('<4sIII')
+    meta = json.loads(data[offset:offset + meta_len])
+    offset += meta_len
+    arrays = {}
+    for _ in range(count):
+        name_len, dtype_len, ndim = struct.unpack_from('<BBB', data, offset)
+        offset += struct.calcsize('<BBB')
+        name = data[offset:offset + name_len].decode()
+        offset += name_len
+        dtype = np.dtype(data[offset:offset + dtype_len].decode())
+        offset += dtype_len
+        shape = struct.unpack_from(f"<{ndim}q", data, offset)
+        offset += 8 * ndim
+        n = int(np.prod(shape)) if ndim else 1
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=n, offset=offset).reshape(shape)
+        offset += n * dtype.itemsize
+    return meta, arrays
+
+def random_state(rand) -> tuple:
+    'random.Random state as (uint32 words, gauss_next or nan).'
+    version, words, gauss = rand.getstate()
+    return np.array(words, dtype=np.uint32), np.nan if gauss is None else gauss
+
+def set_random_state(rand, words: np.ndarray, gauss: float):
+    rand.setstate((3, tuple(words.tolist()), None if np.isnan(gauss) else float(gauss)))
+
+#############################################################
+
+def snapshot(game) -> bytes:
+    if game.shards:
+        raise ValueError('snapshots of sharded games are not supported')
+    if game.bullets.pending or game.enemies.pending:
+        raise ValueError('snapshot between ticks, after removals are flushed')
+    store, pool = game.store, game.cpu_pool
+    n = store.size
+    arrays = {f"store.{name}": getattr(store, name)[:n] for name in store.COLUMNS}
+    arrays['store.free_rows'] = np.array(store.free_rows, dtype=np.int64)
+    arrays['bullets'] = store.rows(game.bullets).astype(np.int64)
+    enemies = list(game.enemies)
+    arrays['enemies'] = store.rows(enemies).astype(np.int64)
+
+    # Thread state straight from the ProgramBatch arrays, in slot order;
+    # slots maps each slot to its enemy's index in enemies.
+    progs = game.enemy_programs
+    index = {enemy.cpu: e for e, enemy in enumerate(enemies)}
+    now = []
+    for t, prog in enumerate(progs):
+        batch = pool.batches.get(prog)
+        k = len(batch) if batch else 0
+        now.append(batch.now if batch else None)
+        arrays[f"threads.{t}.slots"] = np.array([index[thread.cpu] for thread in batch.threads] if k else [], dtype=np.int64)
+        for name in THREAD_COLUMNS:
+            column = getattr(batch, name)[:k] if k else np.zeros((0,))
+            arrays[f"threads.{t}.{name}"] = column
+        depth = int(batch.sp[:k].max()) if k else 0
+        arrays[f"threads.{t}.stack"] = batch.stack[:k, :depth] if k else np.zeros((0, 0, 2))
+
+    game_words, game_gauss = random_state(game.random)
+    arrays['game.random'] = game_words
+    meta = {
+        'size': n,
+        'player': game.player.row,
+        'programs': [prog.name for prog in progs],
+        'now': now,
+        'rng': pool.rng.bit_generator.state,
+        'frame': game.frame,
+        'time_ms': game.time_ms,
+        'enemy_timer': game.enemy_timer,
+        'accumulator': game.accumulator,
+        'random_gauss': None if np.isnan(game_gauss) else game_gauss,
+    }
+    return pack(meta, arrays)
+
+def restore(game, data: bytes):
+    'Replace the state of game (set up with init()) with a snapshot of the same setup.'
+    if game.shards:
+        raise ValueError('snapshots of sharded games are not supported')
+    meta, arrays = unpack(data)
+    progs = game.enemy_programs
+    if meta['programs'] != [prog.name for prog in progs]:
+        raise ValueError(f"snapshot programs {meta['programs']} do not match {[prog.name for prog in progs]}")
+    store, pool = game.store, game.cpu_pool
+
+    # Drop the current population, then take handles for the snapshot's.
+    for entities in (game.bullets, game.enemies):
+        for entity in list(entities):
+            entities.remove(entity)
+        entities.flush()
+    bullet_rows = arrays['bullets'].tolist()
+    enemy_rows = arrays['enemies'].tolist()
+    bullets = [game.bullet_pool.acquire(V(), V()) for _ in bullet_rows]
+    enemies = [game.enemy_pool.acquire(V(), V()) for _ in enemy_rows]
+
+    # Overwrite the store wholesale, then point the handles at their rows.
+    n = meta['size']
+    store.grow(n)
+    for name in store.COLUMNS:
+        column = getattr(store, name)
+        column[:n] = arrays[f"store.{name}"]
+        column[n:] = 0
+    store.size = n
+    store.free_rows = arrays['store.free_rows'].tolist()
+    game.player.rebind(meta['player'])
+    for entity, row in zip(bullets + enemies, bullet_rows + enemy_rows):
+        entity.rebind(row)
+
+    # Threads: join the batches in the saved order, then overwrite the
+    # slots the threads were loaded into with the saved arrays.
+    for e in arrays['threads.0.slots'].tolist() if progs else ():
+        pool.add(enemies[e].cpu)
+    for t, prog in enumerate(progs):
+        batch = pool.batches.get(prog)
+        if batch is None:
+            continue
+        if meta['now'][t] is None:
+            # Not created yet at snapshot time; it is empty now.
+            del pool.batches[prog]
+            continue
+        batch.now = meta['now'][t]
+        slots = arrays[f"threads.{t}.slots"].tolist()
+        dest = np.array([batch.slot[enemies[e].cpu.threads[t]] for e in slots], dtype=np.intp)
+        for name in THREAD_COLUMNS:
+            getattr(batch, name)[dest] = arrays[f"threads.{t}.{name}"]
+        stack = arrays[f"threads.{t}.stack"]
+        batch.stack[dest, :stack.shape[1]] = stack
+        batch.reschedule()
+    pool.rng.bit_generator.state = meta['rng']
+
+    for bullet in bullets:
+        game.bullets.append(bullet)
+    for enemy in enemies:
+        game.enemies.append(enemy)
+    game.bullet_index.update(game.bullets)
+    set_random_state(game.random, arrays['game.random'], np.nan if meta['random_gauss'] is None else meta['random_gauss'])
+    game.frame = meta['frame']
+    game.time_ms = meta['time_ms']
+    game.enemy_timer = meta['enemy_timer']
+    game.accumulator = meta['accumulator']
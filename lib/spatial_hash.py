@@ -0,0 +1,133 @@
+import math
+
+# Neighbour cells visited from each cell so every pair of cells is seen once.
+HALF_STENCIL = ((1, 0), (-1, 1), (0, 1), (1, 1))
+
+class SpatialHash:
+    '''
+    Uniform grid broad-phase.
+
+    Items are bucketed by every cell their box touches, so a query only
+    looks at items sharing a cell with the query box.
+    '''
+    def __init__(self, cell_size: float):
+        self.cell_size = float(cell_size)
+        self.inv_cell_size = 1.0 / self.cell_size
+        self.cells: dict = {}
+        self.boxes: dict = {}
+
+    def __repr__(self):
+        return f"{type(self).__name__}(cell_size={self.cell_size}, items={len(self.boxes)}, cells={len(self.cells)})"
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def clear(self):
+        self.cells.clear()
+        self.boxes.clear()
+
+    def cell(self, x, y):
+        inv = self.inv_cell_size
+        return (math.floor(x * inv), math.floor(y * inv))
+
+    def cell_keys(self, left, top, right, bottom):
+        inv = self.inv_cell_size
+        x0, x1 = math.floor(left * inv), math.floor(right * inv)
+        y0, y1 = math.floor(top * inv), math.floor(bottom * inv)
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                yield (cx, cy)
+
+    def insert(self, item, left, top, right, bottom):
+        if item in self.boxes:
+            self.remove(item)
+        self.boxes[item] = (left, top, right, bottom)
+        cells = self.cells
+        for key in self.cell_keys(left, top, right, bottom):
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [item]
+            else:
+                bucket.append(item)
+
+    def insert_point(self, item, x, y):
+        self.insert(item, x, y, x, y)
+
+    def insert_rect(self, item, rect):
+        self.insert(item, rect.left, rect.top, rect.right, rect.bottom)
+
+    def remove(self, item):
+        box = self.boxes.pop(item, None)
+        if box is None:
+            return
+        cells = self.cells
+        for key in self.cell_keys(*box):
+            bucket = cells[key]
+            bucket.remove(item)
+            if not bucket:
+                del cells[key]
+
+    def candidates(self, left, top, right, bottom):
+        'Items sharing a cell with the box, each once.'
+        found = {}
+        cells = self.cells
+        for key in self.cell_keys(left, top, right, bottom):
+            bucket = cells.get(key)
+            if bucket:
+                for item in bucket:
+                    found[item] = True
+        return list(found)
+
+    def query(self, left, top, right, bottom):
+        'Items whose box overlaps the given box.'
+        boxes = self.boxes
+        result = []
+        for item in self.candidates(left, top, right, bottom):
+            l, t, r, b = boxes[item]
+            if l < right and left < r and t < bottom and top < b:
+                result.append(item)
+        return result
+
+    def query_radius(self, x, y, r):
+        'Items whose box center lies within r of (x, y).'
+        boxes = self.boxes
+        r2 = r * r
+        result = []
+        for item in self.candidates(x - r, y - r, x + r, y + r):
+            l, t, rr, b = boxes[item]
+            dx = (l + rr) * 0.5 - x
+            dy = (t + b) * 0.5 - y
+            if dx * dx + dy * dy < r2:
+                result.append(item)
+        return result
+
+    def pairs_within(self, r):
+        '''
+        All pairs of point items closer than r, as two parallel lists.
+        r must not exceed cell_size so only adjacent cells need checking.
+        '''
+        assert r <= self.cell_size
+        boxes = self.boxes
+        cells = self.cells
+        r2 = r * r
+        pairs_a, pairs_b = [], []
+        for (cx, cy), bucket in cells.items():
+            points = [(item, boxes[item][0], boxes[item][1]) for item in bucket]
+            for i, (a, ax, ay) in enumerate(points):
+                for b, bx, by in points[i + 1:]:
+                    dx, dy = ax - bx, ay - by
+                    if dx * dx + dy * dy < r2:
+                        pairs_a.append(a)
+                        pairs_b.append(b)
+            for ox, oy in HALF_STENCIL:
+                other = cells.get((cx + ox, cy + oy))
+                if not other:
+                    continue
+                for a, ax, ay in points:
+                    for b in other:
+                        bx, by = boxes[b][0], boxes[b][1]
+                        dx, dy = ax - bx, ay - by
+                        if dx * dx + dy * dy < r2:
+                            pairs_a.append(a)
+                            pairs_b.append(b)
+        return pairs_a, pairs_b
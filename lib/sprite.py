@@ -62,15 +62,79 @@ class Rect:
     def __repr__(self):
         return f"Rect({self.pos}, {self.size})"
 
+# Filled surfaces shared by every sprite of the same (width, height, color).
+_surfaces: dict = {}
+
+def sprite_surface(size: V, color: tuple) -> pygame.Surface:
+    key = (size.x, size.y, color)
+    surface = _surfaces.get(key)
+    if surface is None:
+        surface = pygame.Surface((int(size.x), int(size.y)))
+        surface.fill(color)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        _surfaces[key] = surface
+    return surface
+
+def blit_sprites(screen, sprites, centers, doreturn: bool = False):
+    'Draw sprites centered at centers, a list of (x, y), in one Surface.blits call.'
+    seq = [
+        (sprite.surface, (x - sprite.size.x * 0.5, y - sprite.size.y * 0.5))
+        for sprite, (x, y) in zip(sprites, centers)
+    ]
+    return screen.blits(seq, doreturn)
+
 class Sprite:
     def __init__(self, size: V, color: tuple = WHITE):
-        self.pos = V()
+        self._pos = V()
+        self.store = None
+        self.row = None
         self.size = size
         self.color = color
+        # Bounds, recomputed only when the center moves.
+        self._rect = Rect(V(), size)
+        self._rect_center = None
+
+    def bind(self, store, row: int):
+        'Read position from an EntityStore row instead of self._pos.'
+        self.store = store
+        self.row = row
+        self._rect_center = None
+
+    @property
+    def pos(self):
+        if self.store is None:
+            return self._pos
+        return V(*self.store.pos[self.row].tolist())
+
+    @pos.setter
+    def pos(self, pos: V):
+        if self.store is None:
+            self._pos = pos
+        else:
+            self.store.pos[self.row] = (pos.x, pos.y)
+        self._rect_center = None
 
     @property
     def rect(self):
-        return Rect(self.pos, self.size).centered()
+        '''
+        Bounds centered on pos. The same Rect is returned until the sprite
+        moves, so treat it as read-only.
+        '''
+        if self.store is None:
+            center = (self._pos.x, self._pos.y)
+        else:
+            center = tuple(self.store.pos[self.row].tolist())
+        rect = self._rect
+        if center != self._rect_center or rect.size is not self.size:
+            size = rect.size = self.size
+            rect.pos.set(center[0] - size.x * 0.5, center[1] - size.y * 0.5)
+            self._rect_center = center
+        return rect
+
+    @property
+    def surface(self):
+        return sprite_surface(self.size, self.color)
 
     @property
     def width(self):
@@ -80,10 +144,10 @@ class Sprite:
     def height(self):
         return self.size.y
 
-    def draw(self, screen):
-        pygame.draw.rect(
-            screen,
-            self.color,
-            self.rect.as_tuple(),
-        )
+    def draw(self, screen, pos: V = None):
+        'pos overrides the center, e.g. an interpolated position.'
+        if pos is None:
+            pos = self.pos
+        size = self.size
+        screen.blit(self.surface, (pos.x - size.x * 0.5, pos.y - size.y * 0.5))
         return self
@@ -0,0 +1,120 @@
+'''
+Per-step entity positions and velocities, logged to memory-mapped files.
+
+    writer = TrajectoryWriter('run')      # run.00000.traj, run.00001.traj, ...
+    writer.write(game)                    # once per Game.tick
+    writer.close()
+
+    for records in read('run'):           # zero-copy views, one per chunk
+        records['pos'][records['kind'] == KIND_ENEMY]
+
+Each chunk is a 64-byte header followed by fixed-size RECORD entries,
+one per live EntityStore row per step. The header holds the number of
+records written so far and is updated after every step, so readers
+(even of a run that is still going, or crashed) only see whole steps.
+A chunk is rotated once it has no room for the next step.
+'''
+import glob
+import struct
+import numpy as np
+
+RECORD = np.dtype([
+    ('frame', '<u4'),
+    ('id', '<u4'),
+    ('kind', 'u1'),
+    ('pos', '<f4', 2),
+    ('vel', '<f4', 2),
+])
+
+# EntityStore.kind values (Entity.KIND of each class).
+KIND_ENTITY, KIND_PLAYER, KIND_BULLET, KIND_ENEMY = range(4)
+
+MAGIC = b'TRAJ'
+VERSION = 1
+HEADER_SIZE = 64
+# magic, version, record size, capacity, count
+HEADER = struct.Struct('<4sIIQQ')
+COUNT_OFFSET = struct.calcsize('<4sIIQ')
+
+def chunk_path(prefix: str, index: int) -> str:
+    return f"{prefix}.{index:05d}.traj"
+
+class TrajectoryWriter:
+    def __init__(self, prefix: str, chunk_records: int = 1 << 20):
+        self.prefix = prefix
+        self.chunk_records = chunk_records
+        self.chunk = -1
+        self.map = None
+        self.records = None
+        self.count_field = None
+        self.count = 0
+        self.written = 0
+        self.open_chunk()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(prefix={self.prefix!r}, chunk={self.chunk}, count={self.count}, written={self.written})"
+
+    def open_chunk(self):
+        self.close_chunk()
+        self.chunk += 1
+        size = HEADER_SIZE + self.chunk_records * RECORD.itemsize
+        self.map = np.memmap(chunk_path(self.prefix, self.chunk), dtype=np.uint8, mode='w+', shape=(size,))
+        self.map[:HEADER.size] = np.frombuffer(
+            HEADER.pack(MAGIC, VERSION, RECORD.itemsize, self.chunk_records, 0), dtype=np.uint8)
+        self.count_field = self.map[COUNT_OFFSET:COUNT_OFFSET + 8].view('<u8')
+        self.records = self.map[HEADER_SIZE:].view(RECORD)
+        self.count = 0
+
+    def close_chunk(self):
+        if self.map is not None:
+            self.count_field[0] = self.count
+            self.map.flush()
+            self.map = self.records = self.count_field = None
+
+    def write(self, game):
+        'Append one record per live row of game.store, tagged with game.frame.'
+        store = game.store
+        rows = np.flatnonzero(store.alive[:store.size])
+        self.write_rows(store, rows, game.frame)
+
+    def write_rows(self, store, rows: np.ndarray, frame: int):
+        n = len(rows)
+        if self.count + n > self.chunk_records and self.count:
+            self.open_chunk()
+        start = 0
+        while start < n:
+            # Only a step bigger than a whole chunk gets split.
+            k = min(n - start, self.chunk_records - self.count)
+            if k == 0:
+                self.open_chunk()
+                continue
+            part = rows[start:start + k]
+            out = self.records[self.count:self.count + k]
+            out['frame'] = frame
+            out['id'] = store.id[part]
+            out['kind'] = store.kind[part]
+            out['pos'] = store.pos[part]
+            out['vel'] = store.vel[part]
+            self.count += k
+            start += k
+        self.count_field[0] = self.count
+        self.written += n
+
+    def close(self):
+        self.close_chunk()
+
+def read_chunk(path: str) -> np.ndarray:
+    'The records written to one chunk, as a read-only memory map.'
+    with open(path, 'rb') as f:
+        magic, version, record_size, capacity, count = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path}: not a trajectory chunk")
+    if version != VERSION or record_size != RECORD.itemsize:
+        raise ValueError(f"{path}: unsupported trajectory version {version}")
+    if not count:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+def read(prefix: str) -> list:
+    'Every chunk of a trajectory, in order.'
+    return [read_chunk(path) for path in sorted(glob.glob(f"{glob.escape(prefix)}.*.traj"))]
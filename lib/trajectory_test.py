@@ -0,0 +1,30 @@
+import os
+import tempfile
+import numpy as np
+from vector2d import V
+from entity import Entity
+from entity_store import EntityStore
+from sprite import Sprite
+from trajectory import TrajectoryWriter, read
+
+# Steps of 40 rows into chunks of 8: every step is split across chunks.
+store = EntityStore()
+entities = [Entity(V(i, -i), V(1.0, 2.0), Sprite(V()), store=store) for i in range(40)]
+rows = np.arange(len(entities))
+with tempfile.TemporaryDirectory() as tmp:
+    prefix = os.path.join(tmp, 'run')
+    writer = TrajectoryWriter(prefix, 8)
+    for frame in range(1, 201):
+        writer.write_rows(store, rows[: 35 + frame % 6], frame)
+    writer.close()
+    chunks = read(prefix)
+    assert sum(len(c) for c in chunks) == writer.written, ([len(c) for c in chunks], writer.written)
+    records = np.concatenate(chunks)
+    assert (np.diff(records['frame'].astype(int)) >= 0).all()
+    last = records[records['frame'] == 200]
+    assert len(last) == 35 + 200 % 6
+    assert (last['id'] == store.id[rows[:len(last)]]).all()
+    assert np.allclose(last['pos'], store.pos[rows[:len(last)]])
+    del chunks, records, last
+
+print('ok')
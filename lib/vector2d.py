@@ -2,16 +2,22 @@
 
 import math
 from math import pi
+from numbers import Real
 from random import Random
+import numpy as np
 
 M_PI_PER_DEG = pi / 18.0
 
 def lerp(t, x0, x1):
     return x0 * (1 - t) + x1 * t
 
+SCALAR = (int, float)
+
 class Vector2D:
     """A two-dimensional vector with Cartesian coordinates."""
 
+    __slots__ = ('x', 'y')
+
     def __init__(self, x = 0.0, y = None):
         self.x, self.y = float(x), float(y if y is not None else x)
 
@@ -27,9 +33,57 @@ class Vector2D:
         """Return a tuple."""
         return (self.x, self.y)
 
+    # In-place operations, for hot loops that own their vectors.
+    # Never use them on shared constants like V_0.
+
+    def set(self, x, y = None):
+        """Set both components in place."""
+        self.x, self.y = float(x), float(y if y is not None else x)
+        return self
+
+    def iadd(self, other):
+        """In-place vector addition."""
+        if isinstance(other, SCALAR):
+            self.x += other
+            self.y += other
+        else:
+            v = Vector2D.coerce(other)
+            if v is NotImplemented:
+                raise TypeError(f"unsupported operand for in-place +=: {type(other).__name__}")
+            self.x += v.x
+            self.y += v.y
+        return self
+
+    def isub(self, other):
+        """In-place vector subtraction."""
+        if isinstance(other, SCALAR):
+            self.x -= other
+            self.y -= other
+        else:
+            v = Vector2D.coerce(other)
+            if v is NotImplemented:
+                raise TypeError(f"unsupported operand for in-place -=: {type(other).__name__}")
+            self.x -= v.x
+            self.y -= v.y
+        return self
+
+    def imul_scalar(self, scalar):
+        """In-place multiplication by a scalar."""
+        self.x *= scalar
+        self.y *= scalar
+        return self
+
+    def iadd_scaled(self, other, scalar):
+        """In-place self += other * scalar, without the temporary."""
+        self.x += other.x * scalar
+        self.y += other.y * scalar
+        return self
+
     def dot(self, other):
         """The scalar (dot) product of self and other. Both must be vectors."""
         other = Vector2D.coerce(other)
+        if other is NotImplemented:
+            return NotImplemented
         return self.x * other.x + self.y * other.y
     # Alias the __matmul__ method to dot so we can use a @ b as well as a.dot(b).
     __matmul__ = dot
@@ -39,17 +93,29 @@ class Vector2D:
 
     def __sub__(self, other):
         """Vector subtraction."""
+        if isinstance(other, SCALAR):
+            return Vector2D(self.x - other, self.y - other)
         other = Vector2D.coerce(other)
+        if other is NotImplemented:
+            return NotImplemented
         return Vector2D(self.x - other.x, self.y - other.y)
 
     def __add__(self, other):
         """Vector addition."""
+        if isinstance(other, SCALAR):
+            return Vector2D(self.x + other, self.y + other)
         other = Vector2D.coerce(other)
+        if other is NotImplemented:
+            return NotImplemented
         return Vector2D(self.x + other.x, self.y + other.y)
 
     def __mul__(self, other):
         """Multiplication of a vector by a scalar."""
+        if isinstance(other, SCALAR):
+            return Vector2D(self.x * other, self.y * other)
         other = Vector2D.coerce(other)
+        if other is NotImplemented:
+            return NotImplemented
         return Vector2D(self.x * other.x, self.y * other.y)
 
     def __rmul__(self, scalar):
@@ -62,12 +128,18 @@ class Vector2D:
 
     def __truediv__(self, other):
         """True division of the vector by a scalar."""
+        if isinstance(other, SCALAR):
+            return Vector2D(self.x / other, self.y / other)
         other = Vector2D.coerce(other)
+        if other is NotImplemented:
+            return NotImplemented
         return Vector2D(self.x / other.x, self.y / other.y)
 
     def __mod__(self, other):
         """One way to implement modulus operation: for each component."""
         other = Vector2D.coerce(other)
+        if other is NotImplemented:
+            return NotImplemented
         return Vector2D(self.x % other.x, self.y % other.y)
 
     def __abs__(self):
@@ -111,12 +183,17 @@ class Vector2D:
 
     @classmethod
     def coerce(cls, x):
+        """
+        A Vector2D from a vector, pair or number; NotImplemented for
+        anything else, so operators can defer to e.g. Vector2DArray.
+        """
         if isinstance(x, cls):
             return x
         if isinstance(x, (tuple, list)):
             return cls(*x)
-        # print(f"coerce({x!r})"); jkasldkfjs
-        return cls(x, x)
+        if isinstance(x, Real):
+            return cls(x, x)
+        return NotImplemented
 
     @classmethod
     def random(cls, x0, x1, rand: Random):
@@ -148,6 +225,184 @@ V_0 = V_ZERO = Vector2D(0.0, 0.0)
 V_1 = V_POS_1 = Vector2D(1.0, 1.0)
 V__1 = V_NEG_1 = Vector2D(-1.0, -1.0)
 
+def as_generator(rand):
+    'Accept a numpy Generator or a random.Random (used as a seed source).'
+    if rand is None:
+        return np.random.default_rng()
+    if isinstance(rand, Random):
+        return np.random.default_rng(rand.getrandbits(64))
+    return rand
+
+class Vector2DArray:
+    """
+    N two-dimensional vectors stored as an N x 2 array.
+
+    Mirrors the Vector2D API; operands may be another Vector2DArray,
+    a single Vector2D (or 2-tuple), a scalar or an array of N scalars,
+    and are broadcast against every row.
+    """
+
+    __slots__ = ('a',)
+
+    def __init__(self, a):
+        self.a = np.asarray(a, dtype=float).reshape(-1, 2)
+
+    @classmethod
+    def zeros(cls, n):
+        return cls(np.zeros((n, 2)))
+
+    @classmethod
+    def from_vectors(cls, vectors):
+        return cls([(v.x, v.y) for v in vectors])
+
+    def to_vectors(self):
+        return [Vector2D(x, y) for x, y in self.a.tolist()]
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.a.tolist()!r})"
+
+    __str__ = __repr__
+
+    def __len__(self):
+        return len(self.a)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, np.integer)):
+            return Vector2D(*self.a[i].tolist())
+        return Vector2DArray(self.a[i])
+
+    def __iter__(self):
+        return iter(self.to_vectors())
+
+    @property
+    def x(self):
+        return self.a[:, 0]
+
+    @property
+    def y(self):
+        return self.a[:, 1]
+
+    @classmethod
+    def coerce(cls, x):
+        """
+        Return something that broadcasts against an N x 2 array.
+
+        A V or a tuple is one vector; a 1-D array or list always holds
+        one scalar per row, whatever its length.
+        """
+        if isinstance(x, cls):
+            return x.a
+        if isinstance(x, Vector2D):
+            return np.array((x.x, x.y))
+        if isinstance(x, SCALAR):
+            return float(x)
+        if isinstance(x, tuple):
+            return np.array(x, dtype=float)
+        x = np.asarray(x, dtype=float)
+        if x.ndim == 1:
+            return x[:, None]
+        return x
+
+    def dot(self, other):
+        """Row-wise dot product, an array of N scalars."""
+        other = np.broadcast_to(Vector2DArray.coerce(other), self.a.shape)
+        return self.a[:, 0] * other[:, 0] + self.a[:, 1] * other[:, 1]
+    __matmul__ = dot
+
+    def __add__(self, other):
+        return Vector2DArray(self.a + Vector2DArray.coerce(other))
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Vector2DArray(self.a - Vector2DArray.coerce(other))
+
+    def __rsub__(self, other):
+        return Vector2DArray(Vector2DArray.coerce(other) - self.a)
+
+    def __mul__(self, other):
+        return Vector2DArray(self.a * Vector2DArray.coerce(other))
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return Vector2DArray(self.a / Vector2DArray.coerce(other))
+
+    def __rtruediv__(self, other):
+        return Vector2DArray(Vector2DArray.coerce(other) / self.a)
+
+    def __mod__(self, other):
+        return Vector2DArray(self.a % Vector2DArray.coerce(other))
+
+    def __neg__(self):
+        return Vector2DArray(- self.a)
+
+    def __abs__(self):
+        return Vector2DArray(np.abs(self.a))
+
+    def distance_to(self, other):
+        return abs(self - other)
+
+    def to_polar(self):
+        return self.norm(), np.arctan2(self.a[:, 1], self.a[:, 0])
+
+    def norm(self):
+        'The norms (lengths).'
+        x, y = self.a[:, 0], self.a[:, 1]
+        return np.sqrt(x * x + y * y)
+
+    def normal_and_norm(self):
+        'Zero vectors stay zero, like Vector2D.normal_and_norm.'
+        norm = self.norm()
+        inv = np.divide(1.0, norm, out=np.zeros_like(norm), where=norm != 0)
+        inv[norm == 0] = 1.0
+        return Vector2DArray(self.a * inv[:, None]), norm
+
+    def normal(self):
+        return self.normal_and_norm()[0]
+
+    def reflected(self, nn):
+        '''Presume nn is normal.'''
+        nn = np.broadcast_to(Vector2DArray.coerce(nn), self.a.shape)
+        return Vector2DArray(self.a - (2 * self.dot(nn))[:, None] * nn)
+
+    def rotated(self, deg):
+        theta = np.asarray(deg, dtype=float) * M_PI_PER_DEG
+        cos_theta = np.cos(theta)
+        sin_theta = np.sin(theta)
+        x, y = self.a[:, 0], self.a[:, 1]
+        return Vector2DArray(np.stack((
+            cos_theta * x - sin_theta * y,
+            sin_theta * x + cos_theta * y), axis=-1))
+
+    @classmethod
+    def random(cls, n, x0, x1, rand = None):
+        t = as_generator(rand).random((n, 2))
+        return cls(lerp(t, cls.coerce(x0), cls.coerce(x1)))
+
+    @classmethod
+    def random_in_circle(cls, n, rand = None):
+        rand = as_generator(rand)
+        a = np.empty((n, 2))
+        todo = np.arange(n)
+        while len(todo):
+            p = rand.uniform(-1.0, 1.0, (len(todo), 2))
+            ok = p[:, 0] * p[:, 0] + p[:, 1] * p[:, 1] < 1.0
+            a[todo[ok]] = p[ok]
+            todo = todo[~ ok]
+        return cls(a)
+
+    @classmethod
+    def random_on_circle(cls, n, rand = None):
+        return cls.random_in_circle(n, rand).normal()
+
+    @classmethod
+    def lerp(cls, t, x0, x1):
+        t = np.asarray(t, dtype=float)
+        if t.ndim == 1:
+            t = t[:, None]
+        return cls(lerp(t, cls.coerce(x0), cls.coerce(x1)))
+
+VA = Vector2DArray
+
 if __name__ == '__main__':
     v1 = Vector2D(2, 5/3)
     v2 = Vector2D(3, -1.5)
@@ -0,0 +1,59 @@
+import numpy as np
+from vector2d import V, VA
+from entity import Entity
+from entity_store import EntityStore, repel_pairs
+from sprite import Sprite
+
+def close(va, vectors):
+    return np.allclose(va.a, [(v.x, v.y) for v in vectors])
+
+# VA against Vector2D, row by row; N = 2 is where a per-row scalar
+# array and a single vector have the same shape.
+rng = np.random.default_rng(1)
+for n in (1, 2, 3):
+    a = rng.uniform(-5.0, 5.0, (n, 2))
+    b = rng.uniform(-5.0, 5.0, (n, 2))
+    s = rng.uniform(0.5, 2.0, n)
+    va, vb = VA(a), VA(b)
+    vs, ws = va.to_vectors(), vb.to_vectors()
+    k = V(2.0, -3.0)
+    assert close(va + vb, [v + w for v, w in zip(vs, ws)])
+    assert close(va - vb, [v - w for v, w in zip(vs, ws)])
+    assert close(va * s, [v * x for v, x in zip(vs, s.tolist())]), n
+    assert close(va / s, [v / x for v, x in zip(vs, s.tolist())]), n
+    assert close(va * k, [v * k for v in vs])
+    assert close(va * (2.0, -3.0), [v * k for v in vs])
+    assert close(va - k, [v - k for v in vs])
+    assert close(va * 1.5, [v * 1.5 for v in vs])
+    # A single V on the left defers to Vector2DArray.
+    assert close(k + va, [k + v for v in vs])
+    assert close(k - va, [k - v for v in vs])
+    assert close(k * va, [k * v for v in vs])
+    assert close(k / va, [k / v for v in vs])
+    assert close((2.0, -3.0) - va, [k - v for v in vs])
+    assert np.allclose(va.dot(vb), [v.dot(w) for v, w in zip(vs, ws)])
+    assert np.allclose(va.norm(), [v.norm() for v in vs])
+    assert close(va.normal(), [v.normal() for v in vs])
+    assert close(va.reflected(vb.normal()), [v.reflected(w.normal()) for v, w in zip(vs, ws)])
+    assert close(va.rotated(s), [v.rotated(x) for v, x in zip(vs, s.tolist())]), n
+
+# A 1-D array is per-row scalars whatever its length; vectors are V or tuples.
+try:
+    VA(np.ones((3, 2))) * np.array((2.0, 3.0))
+    raise AssertionError('a (2,) array against 3 rows should not broadcast')
+except ValueError:
+    pass
+
+# repel_pairs against Entity.repel, for one to three overlapping pairs.
+for n in (1, 2, 3):
+    pos = [(x, y) for x, y in rng.uniform(0.0, 10.0, (2 * n, 2)).tolist()]
+    scalar, batch = EntityStore(), EntityStore()
+    es = [Entity(V(*p), V(), Sprite(V()), store=scalar) for p in pos]
+    for p in pos:
+        Entity(V(*p), V(), Sprite(V()), store=batch)
+    for i in range(n):
+        es[2 * i].repel(es[2 * i + 1], 20.0)
+    repel_pairs(batch, np.arange(0, 2 * n, 2), np.arange(1, 2 * n, 2), 20.0)
+    assert np.allclose(scalar.acc[:2 * n], batch.acc[:2 * n]), n
+
+print('ok')